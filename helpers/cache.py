@@ -0,0 +1,263 @@
+"""
+Helper module for caching, of input cubes in memory within one ScriptEngine
+run, and of derived grid arrays and rendered plots on disk across tasks and legs.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+# Default memory cap of the shared input cube cache, in bytes.
+# Can be overridden with the environment variable ECE_MONITORING_CUBE_CACHE_MB.
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+# Default disk cap of the array cache, in bytes.
+# Can be overridden with the environment variable ECE_MONITORING_ARRAY_CACHE_MB.
+DEFAULT_ARRAY_CACHE_BYTES = 2 * 1024**3
+
+# Default disk cap of the render cache, in bytes.
+# Can be overridden with the environment variable ECE_MONITORING_RENDER_CACHE_MB.
+DEFAULT_RENDER_CACHE_BYTES = 512 * 1024**2
+
+
+def cache_dir():
+    """Directory for arrays cached on disk across legs, e.g. grid weights"""
+    default = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")) / "ece-monitoring"
+    return Path(os.environ.get("ECE_MONITORING_CACHE_DIR", default)).expanduser()
+
+
+def _max_bytes(variable, default):
+    max_mb = os.environ.get(variable)
+    return default if max_mb is None else int(float(max_mb) * 1024**2)
+
+
+def load_array(name):
+    """Return the array cached on disk under name, memory-mapped, or None."""
+    cache_file = cache_dir() / name
+    try:
+        array = np.load(cache_file, mmap_mode="r")
+        os.utime(cache_file)  # mark as recently used
+    except (OSError, ValueError):
+        return None
+    return array
+
+
+def save_array(name, array, description="array", max_bytes=None):
+    """
+    Cache an array on disk under name (a .npy file name).
+
+    The file is written atomically, so that concurrent tasks never read a
+    partial file. Least recently used arrays are removed when the cache grows
+    beyond max_bytes. If the cache directory is not writable, a warning is
+    issued.
+    """
+    if max_bytes is None:
+        max_bytes = _max_bytes(
+            "ECE_MONITORING_ARRAY_CACHE_MB", DEFAULT_ARRAY_CACHE_BYTES
+        )
+    cache_file = cache_dir() / name
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=cache_file.parent, suffix=".npy", delete=False
+        ) as tmp_file:
+            np.save(tmp_file, array)
+        os.replace(tmp_file.name, cache_file)
+    except OSError as error:
+        warnings.warn(f"Could not cache {description} in {cache_file}: {error}")
+        return
+    _evict(cache_file.parent.glob("*.npy"), max_bytes)
+
+
+def render_key(src, *args, **kwargs):
+    """
+    Return a cache key for a plot of the file src, made with the given arguments.
+
+    The key is a hash of the file contents and the arguments, so that a
+    diagnostic that is unchanged since the last leg is not plotted again.
+    """
+    key = hashlib.sha1()
+    with open(src, "rb") as src_file:
+        for chunk in iter(lambda: src_file.read(1024**2), b""):
+            key.update(chunk)
+    key.update(json.dumps([args, kwargs], sort_keys=True, default=str).encode())
+    return key.hexdigest()
+
+
+def _render_dir():
+    return cache_dir() / "renders"
+
+
+def load_render(key, dst_file):
+    """
+    Copy the plot cached under key to dst_file.
+
+    Returns True on a cache hit, False if the plot has to be rendered.
+    """
+    cache_file = _render_dir() / f"{key}.png"
+    try:
+        shutil.copyfile(cache_file, dst_file)
+        os.utime(cache_file)  # mark as recently used
+    except OSError:
+        return False
+    return True
+
+
+def save_render(key, src_file, max_bytes=None):
+    """
+    Cache the rendered plot src_file under key.
+
+    Least recently used plots are removed when the cache grows beyond
+    max_bytes. If the cache directory is not writable, a warning is issued.
+    """
+    if max_bytes is None:
+        max_bytes = _max_bytes(
+            "ECE_MONITORING_RENDER_CACHE_MB", DEFAULT_RENDER_CACHE_BYTES
+        )
+    cache_file = _render_dir() / f"{key}.png"
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=cache_file.parent, suffix=".tmp", delete=False
+        ) as tmp_file:
+            with open(src_file, "rb") as src:
+                shutil.copyfileobj(src, tmp_file)
+        os.replace(tmp_file.name, cache_file)
+    except OSError as error:
+        warnings.warn(f"Could not cache plot in {cache_file}: {error}")
+        return
+    _evict(_render_dir().glob("*.png"), max_bytes)
+
+
+def _evict(cache_files, max_bytes):
+    """Remove the least recently used of cache_files beyond max_bytes."""
+    files = []
+    for cache_file in cache_files:
+        try:
+            stat = cache_file.stat()
+        except OSError:  # removed by a concurrent task
+            continue
+        files.append((stat.st_mtime, stat.st_size, cache_file))
+    nbytes = sum(size for _, size, _ in files)
+    for _, size, cache_file in sorted(files, key=lambda cache_file: cache_file[0]):
+        if nbytes <= max_bytes:
+            break
+        try:
+            cache_file.unlink()
+        except OSError:
+            continue
+        nbytes -= size
+
+
+def file_key(src):
+    """
+    Return a cache key for input file(s), or None if they can not be cached.
+
+    The key holds the resolved path, modification time and size of each file,
+    so that a file that is rewritten during the run is not served from cache.
+    Glob patterns and non-existing paths return None.
+    """
+    paths = [src] if isinstance(src, (str, os.PathLike)) else src
+    key = []
+    try:
+        for path in paths:
+            path = Path(path).expanduser().resolve()
+            stat = path.stat()
+            key.append((str(path), stat.st_mtime_ns, stat.st_size))
+    except (OSError, TypeError):
+        return None
+    return tuple(key)
+
+
+def _nbytes(cube):
+    """Approximate memory footprint of a cube once realised, in bytes."""
+    data = cube.core_data()
+    nbytes = data.nbytes
+    if cube.has_lazy_data() or np.ma.isMaskedArray(data):
+        nbytes += int(np.prod(cube.shape))  # boolean mask
+    for coord in cube.coords():
+        nbytes += coord.core_points().nbytes
+        if coord.has_bounds():
+            nbytes += coord.core_bounds().nbytes
+    return nbytes
+
+
+def _set_read_only(data):
+    data.flags.writeable = False
+    if np.ma.isMaskedArray(data) and data.mask is not np.ma.nomask:
+        data.mask.flags.writeable = False
+
+
+class CubeCache:
+    """
+    Least recently used cache of realised cubes, capped in memory.
+
+    Cached data is read-only and shared between all cubes handed out by get(),
+    which only copy the metadata and coordinates. A consumer that changes the
+    data has to assign new data to its cube (as all Iris operations do), so
+    the cached data stays untouched for the next consumer.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_mb = os.environ.get("ECE_MONITORING_CUBE_CACHE_MB")
+            max_bytes = (
+                DEFAULT_MAX_BYTES if max_mb is None else int(float(max_mb) * 1024**2)
+            )
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._cubes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cubes)
+
+    def get(self, key):
+        """Return a copy-on-write cube for key, or None if not cached."""
+        with self._lock:
+            try:
+                cube, _ = self._cubes[key]
+            except KeyError:
+                return None
+            self._cubes.move_to_end(key)
+        return cube.copy(data=cube.data.view())
+
+    def put(self, key, cube):
+        """
+        Realise and cache a cube, evicting least recently used cubes if needed.
+
+        Returns a copy-on-write cube to be used in place of the cached one.
+        Cubes larger than the memory cap are not cached, and their data stays
+        lazy if it has not been loaded yet.
+        """
+        nbytes = _nbytes(cube)
+        if nbytes > self.max_bytes:
+            return cube
+        _set_read_only(cube.data)
+        with self._lock:
+            if key in self._cubes:
+                self.nbytes -= self._cubes.pop(key)[1]
+            while self._cubes and self.nbytes + nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._cubes.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+            self._cubes[key] = (cube, nbytes)
+            self.nbytes += nbytes
+        return cube.copy(data=cube.data.view())
+
+    def clear(self):
+        """Remove all cubes from the cache."""
+        with self._lock:
+            self._cubes.clear()
+            self.nbytes = 0
+
+
+# Cache shared by all tasks in the same ScriptEngine process
+input_cubes = CubeCache()
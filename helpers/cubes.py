@@ -1,8 +1,13 @@
 """Helper module for Iris cubes."""
 
+import functools
+import hashlib
 import warnings
 
+import cf_units
+import dask.array as da
 import iris
+import iris.analysis
 import iris.analysis.cartography
 import iris.cube
 import iris.warnings
@@ -13,12 +18,42 @@ from scriptengine.exceptions import (
     ScriptEngineTaskRunError,
 )
 
+import helpers.cache
 from helpers.dates import month_number
-from helpers.nemo import remove_unique_attributes
 
 
-def load_input_cube(src, varname):
-    """Load input file(s) into one cube."""
+def load_input_cube(src, varname, cache=True):
+    """
+    Load input file(s) into one cube.
+
+    Cubes are cached in memory, keyed by the input files and varname, so that
+    other tasks in the same run loading the same variable skip the I/O.
+    The returned cube shares its (read-only) data with the cache.
+    Caching realises the data, so with cache=False the cache is bypassed and
+    the cube keeps its lazy data, e.g. for processing it in blocks.
+    """
+    return load_input_cubes(src, [varname], cache)[varname]
+
+
+def load_input_cubes(src, varnames, cache=True):
+    """
+    Load several variables from input file(s) in one pass.
+
+    Returns a dict that maps each varname to one cube, like load_input_cube.
+    Variables that are already cached are not read again.
+    """
+    key = helpers.cache.file_key(src) if cache else None
+    cacheable = key is not None and all(isinstance(name, str) for name in varnames)
+    cubes = {}
+    if cacheable:
+        for varname in varnames:
+            cube = helpers.cache.input_cubes.get((key, varname))
+            if cube is not None:
+                cubes[varname] = cube
+    missing = [varname for varname in varnames if varname not in cubes]
+    if not missing:
+        return cubes
+
     with warnings.catch_warnings():
         # Suppress psu warning
         warnings.filterwarnings(
@@ -26,7 +61,23 @@ def load_input_cube(src, varname):
             message="Ignoring netCDF variable",
             category=UserWarning,
         )
-        month_cubes = iris.load(src, varname)
+        loaded_cubes = iris.load(src, missing)
+    for varname in missing:
+        cube = _concatenate_input_cubes(loaded_cubes.extract(varname), src, varname)
+        if cacheable:
+            cube = helpers.cache.input_cubes.put((key, varname), cube)
+        cubes[varname] = cube
+    return cubes
+
+
+def remove_unique_attributes(cube):
+    drop = ("uuid", "timeStamp")  # these are unique for each NEMO file
+    for attribute in drop:
+        cube.attributes.pop(attribute, None)
+    return cube
+
+
+def _concatenate_input_cubes(month_cubes, src, varname):
     if len(month_cubes) == 0:
         raise ScriptEngineTaskArgumentInvalidError(
             f"varname {varname} not found in {src}"
@@ -89,17 +140,157 @@ def set_metadata(cube, **kwargs):
 
 
 def compute_time_weights(monthly_data_cube, cube_shape=None):
-    """Compute weights for the different month lengths"""
+    """
+    Compute weights for the different month lengths
+
+    The weights are one-dimensional along time, or a read-only view broadcast
+    to cube_shape if given. Prefer the former with weighted_aggregate().
+    """
     time_dim = monthly_data_cube.coord("time", dim_coords=True)
-    month_weights = np.array([bound[1] - bound[0] for bound in time_dim.bounds])
+    month_weights = time_dim.bounds[:, 1] - time_dim.bounds[:, 0]
     if cube_shape:
-        weight_shape = np.ones(cube_shape[1:])
-        month_weights = np.array(
-            [time_weight * weight_shape for time_weight in month_weights]
+        month_weights = np.broadcast_to(
+            month_weights.reshape((-1,) + (1,) * (len(cube_shape) - 1)), cube_shape
         )
     return month_weights
 
 
+def _weighted_sums(subscripts, weights, data, dims):
+    """Weighted sum, sum of valid weights and validity of one block of data."""
+    if not np.ma.is_masked(data):
+        total = np.einsum(subscripts, weights, np.ma.getdata(data), dtype=np.float64)
+        weights_total = np.full(np.shape(total), weights.sum(dtype=np.float64))
+        return total, weights_total, np.full(np.shape(total), True)
+    valid = ~np.ma.getmaskarray(data)
+    total = np.einsum(subscripts, weights, np.ma.filled(data, 0), dtype=np.float64)
+    weights_total = np.einsum(subscripts, weights, valid, dtype=np.float64)
+    return total, weights_total, valid.any(axis=tuple(dims))
+
+
+def weighted_aggregate(
+    cube,
+    coords,
+    weights,
+    operation,
+    block_dim=None,
+    block_size=1,
+    weights_units=None,
+):
+    """
+    Collapse a cube over coords with weights that span only the collapsed dims.
+
+    This is cube.collapsed(coords, operation, weights=...) for MEAN and SUM,
+    with weights of the shape of the collapsed dimensions, e.g. one-dimensional
+    time weights or two/three-dimensional cell sizes. The weights are contracted
+    with the data by einsum, so no weight array of the cube's shape is built.
+    Masked points are ignored, like in Iris.
+
+    If block_dim (one of the collapsed dimensions) is given, lazy data and
+    weights are read and reduced in blocks of block_size along it, e.g. one
+    depth level at a time, accumulating float64 partial sums. Memory is then
+    bounded by one block.
+
+    As in Iris, a SUM has the units of the cube times weights_units, e.g. m2
+    for cell areas.
+    """
+    coords = [coords] if isinstance(coords, str) else list(coords)
+    dims = sorted({dim for coord in coords for dim in cube.coord_dims(coord)})
+    if not isinstance(weights, da.Array):
+        weights = np.asarray(weights)
+    if weights.shape != tuple(cube.shape[dim] for dim in dims):
+        raise ValueError(
+            f"Weights of shape {weights.shape} do not match the collapsed "
+            f"dimensions {dims} of the cube with shape {cube.shape}"
+        )
+    if operation not in (iris.analysis.MEAN, iris.analysis.SUM):
+        raise ValueError(f"Unsupported operation {operation.name()}")
+    if block_dim is not None and block_dim not in dims:
+        raise ValueError(f"Block dimension {block_dim} is not collapsed")
+
+    # Collapse lazy zeros to get the resulting metadata without computing
+    collapsed = cube.copy(data=da.zeros(cube.shape, dtype=cube.dtype))
+    collapsed = collapsed.collapsed(coords, operation)
+    if operation is iris.analysis.SUM and weights_units is not None:
+        collapsed.units = collapsed.units * cf_units.Unit(weights_units)
+
+    letters = "abcdefghijklmnopqrstuvwxyz"[: cube.ndim]
+    weights_letters = "".join(letters[dim] for dim in dims)
+    result_letters = "".join(l for dim, l in enumerate(letters) if dim not in dims)
+    subscripts = f"{weights_letters},{letters}->{result_letters}"
+
+    data = cube.core_data()
+    if block_dim is None:
+        if isinstance(data, da.Array):
+            data = data.compute()
+        weights = np.asarray(weights)
+        if np.ma.is_masked(data):
+            # Filling and masking copy the data, so do it one slice at a time
+            # along a kept dimension, or along a collapsed one if there is none
+            kept = [dim for dim in range(cube.ndim) if dim not in dims]
+            split_dim = kept[0] if kept else dims[0]
+            sums = []
+            for start in range(cube.shape[split_dim]):
+                data_index = [slice(None)] * cube.ndim
+                data_index[split_dim] = slice(start, start + 1)
+                weights_index = [slice(None)] * weights.ndim
+                if not kept:
+                    weights_index[0] = slice(start, start + 1)
+                sums.append(
+                    _weighted_sums(
+                        subscripts,
+                        weights[tuple(weights_index)],
+                        data[tuple(data_index)],
+                        dims,
+                    )
+                )
+            if kept:
+                total, weights_total, any_valid = (
+                    np.concatenate(s) for s in zip(*sums)
+                )
+            else:
+                total, weights_total, any_valid = (
+                    functools.reduce(np.add, s) for s in zip(*sums)
+                )
+        else:
+            total, weights_total, any_valid = _weighted_sums(
+                subscripts, weights, data, dims
+            )
+    else:
+        total, weights_total, any_valid = 0.0, 0.0, False
+        for start in range(0, cube.shape[block_dim], block_size):
+            data_index = [slice(None)] * cube.ndim
+            data_index[block_dim] = slice(start, start + block_size)
+            weights_index = [slice(None)] * weights.ndim
+            weights_index[dims.index(block_dim)] = slice(start, start + block_size)
+            block_data = data[tuple(data_index)]
+            if isinstance(block_data, da.Array):
+                block_data = block_data.compute()
+            block_total, block_weights_total, block_valid = _weighted_sums(
+                subscripts, np.asarray(weights[tuple(weights_index)]), block_data, dims
+            )
+            total = total + block_total
+            weights_total = weights_total + block_weights_total
+            any_valid = any_valid | block_valid
+
+    if operation is iris.analysis.MEAN:
+        result = np.ma.masked_where(
+            np.broadcast_to(weights_total == 0, np.shape(total)),
+            np.divide(
+                total,
+                weights_total,
+                out=np.zeros(np.shape(total)),
+                where=weights_total != 0,
+            ),
+        )
+    else:
+        result = np.ma.masked_where(
+            np.broadcast_to(np.logical_not(any_valid), np.shape(total)), total
+        )
+    dtype = np.result_type(cube.dtype, weights.dtype)
+    collapsed.data = result.astype(dtype).reshape(collapsed.shape)
+    return collapsed
+
+
 def compute_annual_mean(cube):
     # Remove auxiliary time coordinate before collapsing cube
     try:
@@ -107,10 +298,11 @@ def compute_annual_mean(cube):
     except iris.exceptions.CoordinateNotFoundError:
         cube.remove_coord(cube.coord("time", dim_coords=False))
 
-    annual_mean = cube.collapsed(
+    annual_mean = weighted_aggregate(
+        cube,
         "time",
+        compute_time_weights(cube),
         iris.analysis.MEAN,
-        weights=compute_time_weights(cube),
     )
     # Promote time from scalar to dimension coordinate
     annual_mean = iris.util.new_axis(annual_mean, "time")
@@ -168,6 +360,12 @@ def mask_other_hemisphere(cube, hemisphere):
 
 
 def compute_area_weights(cube):
+    """
+    compute area weights of the horizontal grid of an OpenIFS cube
+
+    The weights span only the horizontal dimensions of the cube, to be used with
+    weighted_aggregate().
+    """
     if is_grid_regular(cube):
         return compute_regular_grid_weights(cube)
     return compute_reduced_grid_weights(cube)
@@ -181,29 +379,55 @@ def is_grid_regular(cube) -> bool:
 
 def compute_reduced_grid_weights(cube):
     """compute area weights for the reduced gaussian grid"""
-    nh_latitudes = np.ma.masked_less(cube.coord("latitude").points, 0)
-    unique_lats, gridpoints_per_lat = np.unique(nh_latitudes, return_counts=True)
-    unique_lats, gridpoints_per_lat = unique_lats[0:-1], gridpoints_per_lat[0:-1]
-    areas = []
-    last_angle = 0
+    return reduced_grid_areas(cube.coord("latitude").points)
+
+
+# Grid-point areas of reduced gaussian grids, keyed by a hash of the latitudes
+_reduced_grid_areas = {}
+
+
+def reduced_grid_areas(latitudes):
+    """
+    Compute the grid-point areas of a reduced gaussian grid, in m2.
+
+    The latitudes are expected from north to south, symmetric about the equator.
+    Areas are cached per grid, so they are only computed once per process.
+    """
+    latitudes = np.asarray(latitudes)
+    grid_hash = hashlib.sha1(latitudes.tobytes()).hexdigest()
+    key = (grid_hash, latitudes.shape, latitudes.dtype.str)
+    if key not in _reduced_grid_areas:
+        areas = _compute_reduced_grid_areas(latitudes)
+        areas.flags.writeable = False
+        _reduced_grid_areas[key] = areas
+    return _reduced_grid_areas[key]
+
+
+def _compute_reduced_grid_areas(latitudes):
+    # Northern hemisphere rings, from the equator to the pole
+    unique_lats, gridpoints_per_lat = np.unique(
+        latitudes[latitudes >= 0], return_counts=True
+    )
+    # Ring boundaries lie halfway between the latitudes, starting at the equator:
+    # boundary[i] = 2 * lat[i] - boundary[i - 1] = 2 * sum_j (-1)^(i-j) * lat[j]
+    signs = (-1.0) ** np.arange(len(unique_lats))
+    boundaries = np.empty(len(unique_lats) + 1)
+    boundaries[0] = 0
+    boundaries[1:] = 2 * signs * np.cumsum(signs * unique_lats)
     earth_radius = 6.371229e6  # m
-    for latitude, amount in zip(unique_lats, gridpoints_per_lat):
-        delta = latitude - last_angle
-        current_angle = last_angle + 2 * delta
-        sin_diff = np.sin(np.deg2rad(current_angle)) - np.sin(np.deg2rad(last_angle))
-        ring_area = 2 * np.pi * earth_radius**2 * sin_diff
-        grid_area = ring_area / amount
-        areas.extend([grid_area] * amount)
-        last_angle = current_angle
-    areas = np.append(areas[::-1], areas)
-    area_weights = np.broadcast_to(areas, cube.data.shape)
-    return area_weights
+    ring_areas = 2 * np.pi * earth_radius**2 * np.diff(np.sin(np.deg2rad(boundaries)))
+    areas = np.repeat(ring_areas / gridpoints_per_lat, gridpoints_per_lat)
+    return np.append(areas[::-1], areas)
 
 
 def compute_regular_grid_weights(cube):
     """compute area weights for a regular lat/lon grid"""
     cube.coord("latitude").guess_bounds()
     cube.coord("longitude").guess_bounds()
+    horizontal_dims = cube.coord_dims("latitude") + cube.coord_dims("longitude")
+    horizontal_cube = cube[
+        tuple(slice(None) if dim in horizontal_dims else 0 for dim in range(cube.ndim))
+    ]
     with warnings.catch_warnings():
         # Suppress default radius warning
         warnings.filterwarnings(
@@ -211,7 +435,7 @@ def compute_regular_grid_weights(cube):
             message="Using DEFAULT_SPHERICAL_EARTH_RADIUS",
             category=iris.warnings.IrisDefaultingWarning,
         )
-        return iris.analysis.cartography.area_weights(cube)
+        return iris.analysis.cartography.area_weights(horizontal_cube)
 
 
 def align_time_coords(new_cube, old_cube):
@@ -221,17 +445,59 @@ def align_time_coords(new_cube, old_cube):
     while the other has seconds since 1995-01-01 00:00:00.
     Iris can not concatenate two such cubes.
     """
+    return align_time_coord(new_cube, old_cube.coord("time"))
 
-    old_time_coord = old_cube.coord("time")
 
+def align_time_coord(new_cube, old_time_coord):
+    """
+    Align the time coordinate of a cube with a given time coordinate.
+    Same as align_time_coords, for when only the old time coordinate is at hand.
+    """
     new_cube.coord("time").convert_units(old_time_coord.units)
 
     # We also need to match the attribute time_origin between
     # new_cube and current_cube to make Iris happy.
     # Note: This does not always exist
-    if "time_origin" in old_cube.coord("time").attributes.keys():
-        new_cube.coord("time").attributes["time_origin"] = old_cube.coord(
-            "time"
-        ).attributes["time_origin"]
+    if "time_origin" in old_time_coord.attributes.keys():
+        new_cube.coord("time").attributes["time_origin"] = old_time_coord.attributes[
+            "time_origin"
+        ]
 
     return new_cube
+
+
+def same_records(old_coord, new_coord):
+    """
+    Check if two coordinates in the same units have the same points and bounds,
+    e.g. the last records of a stored diagnostic and those of a leg run again.
+    """
+    if old_coord.shape != new_coord.shape:
+        return False
+    if old_coord.has_bounds() and new_coord.has_bounds():
+        return np.allclose(old_coord.bounds, new_coord.bounds, rtol=1e-9)
+    return np.allclose(old_coord.points, new_coord.points, rtol=1e-9)
+
+
+def record_index(old_coord, new_coord):
+    """
+    Return the index at which new records belong among sorted stored ones,
+    given their coordinates in the same units.
+
+    Records are placed by their bounds, which may touch those of the adjacent
+    records, or by their points if there are no bounds. Raises ValueError if
+    the new records overlap stored ones.
+    """
+    if old_coord.has_bounds() and new_coord.has_bounds():
+        old_start, old_end = old_coord.bounds[:, 0], old_coord.bounds[:, -1]
+        new_start, new_end = new_coord.bounds[0, 0], new_coord.bounds[-1, -1]
+        overlap = np.greater
+    else:
+        old_start = old_end = old_coord.points
+        new_start, new_end = new_coord.points[0], new_coord.points[-1]
+        overlap = np.greater_equal
+    index = int(np.searchsorted(old_start, new_start))
+    if (index > 0 and overlap(old_end[index - 1], new_start)) or (
+        index < len(old_start) and overlap(new_end, old_start[index])
+    ):
+        raise ValueError("New records overlap the stored ones")
+    return index
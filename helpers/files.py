@@ -1,6 +1,9 @@
 """Helper module for handling files."""
 
+import errno
+import fcntl
 import os
+import warnings
 from pathlib import Path
 
 import jinja2
@@ -22,6 +25,62 @@ class ChangeDirectory:
         os.chdir(self.saved_path)
 
 
+# flock errors of file systems without (working) locks, e.g. some NFS mounts
+_unsupported_lock_errors = (errno.ENOLCK, errno.EOPNOTSUPP, errno.ENOSYS)
+
+
+class FileLock:
+    """
+    Context manager for an exclusive lock on a file, for updates of the file
+    by concurrent tasks. The lock is held on a separate "<path>.lock" file, so
+    that the file itself can be replaced, and the lock file is removed again
+    on exit. Where the file system does not support locks, a warning is issued
+    and the file is updated without a lock.
+    """
+
+    def __init__(self, path):
+        self.lock_path = f"{path}.lock"
+        self.lock_file = None
+
+    def __enter__(self):
+        while True:
+            lock_file = open(self.lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except OSError as e:
+                lock_file.close()
+                if e.errno not in _unsupported_lock_errors:
+                    raise
+                warnings.warn(f"Cannot lock {self.lock_path}, continuing without: {e}")
+                self._remove()
+                return
+            # another task may have removed the lock file while we waited for it
+            try:
+                if os.path.samestat(
+                    os.fstat(lock_file.fileno()), os.stat(self.lock_path)
+                ):
+                    self.lock_file = lock_file
+                    return
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def __exit__(self, etype, value, traceback):
+        if self.lock_file is None:
+            return
+        # remove the lock file while holding the lock, see __enter__
+        self._remove()
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+        self.lock_file = None
+
+    def _remove(self):
+        try:
+            os.unlink(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+
 def get_template(context, template):
     """get Jinja2 template file"""
     search_path = [".", "templates"]
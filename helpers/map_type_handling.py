@@ -1,11 +1,23 @@
 """Module containing plot functions for different map types."""
 
+import hashlib
 import warnings
 
 import cartopy.crs as ccrs
+import cartopy.img_transform
 import iris
+import iris.analysis.cartography
+import iris.coord_systems
+import iris.coords
+import iris.cube
 import iris.plot as iplt
+import matplotlib.collections
+import matplotlib.colors
+import matplotlib.path
 import matplotlib.pyplot as plt
+import numpy as np
+
+import helpers.cache
 
 
 def function_mapper(map_type_string):
@@ -27,43 +39,7 @@ def global_ocean_plot(
     **kwargs,
 ):
     """Map Type Handling for Global Ocean Maps"""
-    fig = plt.figure(figsize=(6, 4), dpi=150)
-    fig.suptitle(title)
-    ax = fig.add_subplot(
-        1,
-        1,
-        1,
-        projection=ccrs.PlateCarree(),
-        facecolor="#d3d3d3",
-    )
-    with warnings.catch_warnings():
-        warnings.filterwarnings(
-            action="ignore",
-            message="Coordinate system of latitude and longitude ",
-            category=UserWarning,
-        )
-        warnings.filterwarnings(
-            action="ignore",
-            message="Coordinate 'projection_._coordinate' is",
-            category=UserWarning,
-        )
-        projected_cube, _ = iris.analysis.cartography.project(
-            cube,
-            ccrs.PlateCarree(),
-            nx=800,
-            ny=400,
-        )
-        im = iplt.pcolormesh(
-            projected_cube,
-            axes=ax,
-            vmin=value_range[0],
-            vmax=value_range[1],
-            cmap=colormap,
-        )
-    cbar = fig.colorbar(im, orientation="horizontal")
-    cbar.set_label(units)
-    ax.set_title(dates, fontdict={"fontsize": 8, "fontweight": "medium"})
-    ax.coastlines()
+    fig, _, _ = _global_ocean_map(cube, title, dates, units, value_range, colormap)
     return fig
 
 
@@ -77,6 +53,58 @@ def global_atmosphere_plot(
     **kwargs,
 ):
     """Map Type Handling for Global Atmosphere Maps"""
+    fig, _, _ = _global_atmosphere_map(cube, title, dates, units, value_range, colormap)
+    return fig
+
+
+def polar_ice_sheet_plot(
+    cube,
+    title=None,
+    dates=None,
+    units=None,
+    value_range=[None, None],
+    colormap="RdBu_r",
+    **kwargs,
+):
+    fig, _, _ = _polar_ice_sheet_map(cube, title, dates, units, value_range, colormap)
+    return fig
+
+
+class MapRenderer:
+    """
+    Render the frames of a temporal map into one reused figure.
+
+    The figure, projection, coastlines and colorbar are built with the first
+    frame. Later frames only update the plotted data and the titles.
+    """
+
+    def __init__(self, map_type, value_range=[None, None], colormap="RdBu_r", **kwargs):
+        self.new_map, self.map_data = _map_types[map_type]
+        self.value_range = value_range
+        self.colormap = colormap
+        self.fig = None
+
+    def render(self, cube, title=None, dates=None, units=None):
+        if self.fig is None:
+            self.fig, self.ax, self.mappable = self.new_map(
+                cube, title, dates, units, self.value_range, self.colormap
+            )
+            return self.fig
+        self.mappable.set_array(self.map_data(cube))
+        # autoscale the limits that are not given, as for a new figure
+        self.mappable.norm.vmin, self.mappable.norm.vmax = self.value_range
+        self.mappable.autoscale_None()
+        self.fig.suptitle(title)
+        _set_date_title(self.ax, dates)
+        return self.fig
+
+    def close(self):
+        if self.fig is not None:
+            plt.close(self.fig)
+            self.fig = None
+
+
+def _global_ocean_map(cube, title, dates, units, value_range, colormap):
     fig = plt.figure(figsize=(6, 4), dpi=150)
     fig.suptitle(title)
     ax = fig.add_subplot(
@@ -86,76 +114,363 @@ def global_atmosphere_plot(
         projection=ccrs.PlateCarree(),
         facecolor="#d3d3d3",
     )
-    longitude = cube.coord("longitude").points
-    latitude = cube.coord("latitude").points
-    data = cube.data
-    im = plt.scatter(
-        longitude,
-        latitude,
-        s=1,
-        c=data,
-        axes=ax,
-        vmin=value_range[0],
-        vmax=value_range[1],
-        cmap=colormap,
-        transform=ccrs.PlateCarree(),
-    )
+    im = _projected_pcolormesh(cube, ax, value_range, colormap)
     cbar = fig.colorbar(im, orientation="horizontal")
     cbar.set_label(units)
-    ax.set_title(dates, fontdict={"fontsize": 8, "fontweight": "medium"})
+    _set_date_title(ax, dates)
     ax.coastlines()
-    return fig
+    return fig, ax, im
 
 
-def polar_ice_sheet_plot(
-    cube,
-    title=None,
-    dates=None,
-    units=None,
-    value_range=[None, None],
-    colormap="RdBu_r",
-    **kwargs,
-):
+def _global_atmosphere_map(cube, title, dates, units, value_range, colormap):
     fig = plt.figure(figsize=(6, 4), dpi=150)
     fig.suptitle(title)
-    if "north" in cube.long_name or "North" in cube.long_name:
-        center = 90.0
-    else:
-        center = -90.0
     ax = fig.add_subplot(
         1,
         1,
         1,
-        projection=ccrs.Orthographic(central_latitude=center),
+        projection=ccrs.PlateCarree(),
         facecolor="#d3d3d3",
     )
-    with warnings.catch_warnings():
-        warnings.filterwarnings(
-            action="ignore",
-            message="Coordinate system of latitude and longitude ",
-            category=UserWarning,
+    if _is_reduced_grid(cube):
+        vertices, _ = reduced_grid_cells(
+            cube.coord("latitude").points, cube.coord("longitude").points
+        )
+        # vertices are in PlateCarree degrees already, no need for Cartopy
+        im = matplotlib.collections.PolyCollection(
+            vertices,
+            array=_atmosphere_data(cube),
+            cmap=colormap,
+            norm=matplotlib.colors.Normalize(*value_range),
+            edgecolors="face",  # no gaps between the cells
+            linewidths=0.2,
+            antialiased=False,
+            transform=ax.transData,
+        )
+        im.autoscale_None()
+        ax.add_collection(im)
+        ax.set_global()
+    else:
+        longitude = cube.coord("longitude").points
+        latitude = cube.coord("latitude").points
+        data = cube.data
+        im = plt.scatter(
+            longitude,
+            latitude,
+            s=1,
+            c=data,
+            axes=ax,
+            vmin=value_range[0],
+            vmax=value_range[1],
+            cmap=colormap,
+            transform=ccrs.PlateCarree(),
         )
+    cbar = fig.colorbar(im, orientation="horizontal")
+    cbar.set_label(units)
+    _set_date_title(ax, dates)
+    ax.coastlines()
+    return fig, ax, im
+
+
+def _polar_ice_sheet_map(cube, title, dates, units, value_range, colormap):
+    fig = plt.figure(figsize=(6, 4), dpi=150)
+    fig.suptitle(title)
+    north = _is_north(cube)
+    if _has_2d_grid(cube):
+        projection = _polar_projection(north)
+        ax = fig.add_subplot(1, 1, 1, projection=projection, facecolor="#d3d3d3")
+        radius = _polar_radius(projection)
+        ax.set_extent([-radius, radius, -radius, radius], crs=projection)
+        ax.set_boundary(_unit_circle, transform=ax.transAxes)
+        projected_cube = _polar_cube(cube)
+        im = ax.pcolormesh(
+            projected_cube.coord("projection_x_coordinate").points,
+            projected_cube.coord("projection_y_coordinate").points,
+            projected_cube.data,
+            vmin=value_range[0],
+            vmax=value_range[1],
+            cmap=colormap,
+            transform=projection,
+        )
+    else:
+        ax = fig.add_subplot(
+            1,
+            1,
+            1,
+            projection=ccrs.Orthographic(central_latitude=90.0 if north else -90.0),
+            facecolor="#d3d3d3",
+        )
+        im = _projected_pcolormesh(cube, ax, value_range, colormap)
+    bar = fig.colorbar(im, orientation="horizontal")
+    if units:
+        bar.set_label(units)
+    _set_date_title(ax, dates)
+    ax.coastlines()
+    return fig, ax, im
+
+
+def _is_north(cube):
+    return "north" in cube.long_name or "North" in cube.long_name
+
+
+def _polar_cube(cube):
+    return project_to_polar_stereo(cube, _is_north(cube), nx=600, ny=600)
+
+
+def _polar_data(cube):
+    if _has_2d_grid(cube):
+        return _polar_cube(cube).data
+    return _projected_cube(cube).data
+
+
+# Round boundary of polar maps, in axes coordinates
+_theta = np.linspace(0, 2 * np.pi, 100)
+_unit_circle = matplotlib.path.Path(
+    np.stack([np.sin(_theta), np.cos(_theta)], axis=1) * 0.5 + 0.5
+)
+
+
+def _projected_pcolormesh(cube, ax, value_range, colormap):
+    with warnings.catch_warnings():
         warnings.filterwarnings(
             action="ignore",
             message="Coordinate 'projection_._coordinate' is",
             category=UserWarning,
         )
-        projected_cube, _ = iris.analysis.cartography.project(
-            cube,
-            ccrs.PlateCarree(),
-            nx=800,
-            ny=400,
-        )
-        im = iplt.pcolormesh(
-            projected_cube,
+        return iplt.pcolormesh(
+            _projected_cube(cube),
             axes=ax,
             vmin=value_range[0],
             vmax=value_range[1],
             cmap=colormap,
         )
-    bar = fig.colorbar(im, orientation="horizontal")
-    if units:
-        bar.set_label(units)
+
+
+def _projected_cube(cube):
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            action="ignore",
+            message="Coordinate system of latitude and longitude ",
+            category=UserWarning,
+        )
+        return project_to_plate_carree(cube, nx=800, ny=400)
+
+
+def _set_date_title(ax, dates):
     ax.set_title(dates, fontdict={"fontsize": 8, "fontweight": "medium"})
-    ax.coastlines()
-    return fig
+
+
+_map_types = {
+    "global ocean": (_global_ocean_map, lambda cube: _projected_cube(cube).data),
+    "global atmosphere": (_global_atmosphere_map, lambda cube: _atmosphere_data(cube)),
+    "polar ice sheet": (_polar_ice_sheet_map, _polar_data),
+}
+
+
+def _is_reduced_grid(cube):
+    """Reduced gaussian grids store the grid points along one dimension"""
+    return cube.ndim == 1 and cube.coord_dims("latitude") == cube.coord_dims(
+        "longitude"
+    ) == (0,)
+
+
+def _atmosphere_data(cube):
+    if not _is_reduced_grid(cube):
+        return cube.data
+    _, index = reduced_grid_cells(
+        cube.coord("latitude").points, cube.coord("longitude").points
+    )
+    return np.ma.asarray(cube.data)[index]
+
+
+# Cell polygons of reduced gaussian grids, computed once per grid and process
+_reduced_grid_cells = {}
+
+
+def reduced_grid_cells(latitudes, longitudes):
+    """
+    Return the cell polygons of a reduced gaussian grid, in PlateCarree degrees.
+
+    Cells extend halfway to the neighbouring latitude rings, or to the pole,
+    and across the spacing of the equally spaced points in their ring. Cells
+    that cross the date line are repeated on the other side of the map.
+    Returns the vertices of the polygons, shape (n, 4, 2), and the index of
+    the grid point of each polygon, to look up its value in the field.
+    """
+    latitudes, longitudes = np.asarray(latitudes), np.asarray(longitudes)
+    grid_hash = hashlib.sha1()
+    for array in (latitudes, longitudes):
+        grid_hash.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    key = grid_hash.hexdigest()
+    if key in _reduced_grid_cells:
+        return _reduced_grid_cells[key]
+
+    rings, ring, points_per_ring = np.unique(
+        latitudes, return_inverse=True, return_counts=True
+    )
+    ring = ring.reshape(-1)
+    boundaries = np.concatenate([[-90.0], (rings[1:] + rings[:-1]) / 2, [90.0]])
+    half_width = 180.0 / points_per_ring[ring]
+    longitudes = (longitudes + 180.0) % 360.0 - 180.0
+    west, east = longitudes - half_width, longitudes + half_width
+
+    crossing = np.flatnonzero((west < -180.0) | (east > 180.0))
+    shift = np.where(west[crossing] < -180.0, 360.0, -360.0)
+    index = np.concatenate([np.arange(latitudes.size), crossing])
+    west = np.concatenate([west, west[crossing] + shift])
+    east = np.concatenate([east, east[crossing] + shift])
+    south, north = boundaries[ring[index]], boundaries[ring[index] + 1]
+
+    vertices = np.stack(
+        [
+            np.stack([west, east, east, west], axis=1),
+            np.stack([south, south, north, north], axis=1),
+        ],
+        axis=-1,
+    )
+    _reduced_grid_cells[key] = (vertices, index)
+    return vertices, index
+
+
+# Projection indices per grid, loaded from the disk cache once per process
+_projection_indices = {}
+
+
+def project_to_plate_carree(cube, nx, ny):
+    """
+    Project a 2d cube onto a regular nx * ny PlateCarree grid.
+
+    Gives the same nearest-neighbour result as iris.analysis.cartography.project,
+    but the source index of each target point is computed only once per grid and
+    target resolution, and cached on disk. Projecting a cube is then a single
+    fancy-index on its data. Cubes that are not 2d fall back to Iris.
+    """
+    if not _has_2d_grid(cube):
+        projected_cube, _ = iris.analysis.cartography.project(
+            cube, ccrs.PlateCarree(), nx=nx, ny=ny
+        )
+        return projected_cube
+    lat, lon = cube.coord("latitude"), cube.coord("longitude")
+    target_proj = ccrs.PlateCarree()
+    target_x, target_y, _ = cartopy.img_transform.mesh_projection(target_proj, nx, ny)
+
+    index, mask = _projection_index(
+        lat.points, lon.points, _source_cs(cube), target_proj, target_x, target_y
+    )
+    return _projected_cube_from_index(cube, index, mask, target_x, target_y)
+
+
+# Polar maps reach from the pole to this latitude
+_polar_boundary_latitude = 40.0
+
+
+def _polar_projection(north):
+    return ccrs.NorthPolarStereo() if north else ccrs.SouthPolarStereo()
+
+
+def _polar_radius(projection):
+    """Distance from the pole to the boundary latitude, in projection units"""
+    latitude = _polar_boundary_latitude
+    if isinstance(projection, ccrs.SouthPolarStereo):
+        latitude = -latitude
+    _, y = projection.transform_point(0.0, latitude, ccrs.PlateCarree())
+    return abs(y)
+
+
+def project_to_polar_stereo(cube, north, nx, ny):
+    """
+    Project a 2d cube onto a regular nx * ny polar stereographic grid, which
+    is centred on the north or south pole and reaches to 40 degrees latitude.
+
+    Only the grid points of that hemisphere are searched for the nearest
+    neighbour of each target point. As in project_to_plate_carree, the source
+    index of each target point is cached on disk per grid.
+    """
+    lat, lon = cube.coord("latitude").points, cube.coord("longitude").points
+    if lat.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+    lat, lon = lat.reshape(-1), lon.reshape(-1)
+    target_proj = _polar_projection(north)
+    radius = _polar_radius(target_proj)
+    target_x, target_y, _ = cartopy.img_transform.mesh_projection(
+        target_proj, nx, ny, x_extents=(-radius, radius), y_extents=(-radius, radius)
+    )
+
+    # with a margin, for the neighbours of target points at the boundary
+    hemisphere = np.flatnonzero(
+        (lat if north else -lat) > _polar_boundary_latitude - 5.0
+    )
+    index, mask = _projection_index(
+        lat[np.newaxis, hemisphere],
+        lon[np.newaxis, hemisphere],
+        _source_cs(cube),
+        target_proj,
+        target_x,
+        target_y,
+    )
+    return _projected_cube_from_index(cube, hemisphere[index], mask, target_x, target_y)
+
+
+def _has_2d_grid(cube):
+    lat, lon = cube.coord("latitude"), cube.coord("longitude")
+    return cube.ndim == 2 and cube.coord_dims(lat) + cube.coord_dims(lon) in (
+        (0, 1, 0, 1),  # curvilinear grid
+        (0, 1),  # regular grid
+    )
+
+
+def _source_cs(cube):
+    return cube.coord("latitude").coord_system or iris.coord_systems.GeogCS(
+        iris.analysis.cartography.DEFAULT_SPHERICAL_EARTH_RADIUS
+    )
+
+
+def _projected_cube_from_index(cube, index, mask, target_x, target_y):
+    """Cube on the target grid, taking the data of the cube at index"""
+    data = np.ma.asarray(cube.data).reshape(-1)[index]
+    data = np.ma.masked_where(mask | np.ma.getmaskarray(data), data)
+    if not np.any(data.mask):
+        data = data.data
+
+    projected_cube = iris.cube.Cube(data)
+    projected_cube.add_dim_coord(
+        iris.coords.DimCoord(target_y[:, 0], "projection_y_coordinate", units="m"), 0
+    )
+    projected_cube.add_dim_coord(
+        iris.coords.DimCoord(target_x[0, :], "projection_x_coordinate", units="m"), 1
+    )
+    projected_cube.metadata = cube.metadata
+    return projected_cube
+
+
+def _projection_index(lat, lon, source_cs, target_proj, target_x, target_y):
+    """Return the source index and mask of each target point, cached on disk."""
+    grid_hash = hashlib.sha1()
+    for array in (lat, lon, target_x, target_y):
+        grid_hash.update(np.ascontiguousarray(array).tobytes())
+    grid_hash.update(f"{lat.shape}{source_cs}{target_proj.proj4_init}".encode())
+    cache_name = f"projection_index_{grid_hash.hexdigest()}.npy"
+    if cache_name in _projection_indices:
+        return _projection_indices[cache_name]
+
+    index = helpers.cache.load_array(cache_name)
+    if index is None:
+        if lat.ndim == 1:
+            lon, lat = np.meshgrid(lon, lat)
+        # Regrid the source indices with the same nearest-neighbour search as Iris
+        source_index = np.arange(lat.size).reshape(lat.shape)
+        target_index = cartopy.img_transform.regrid(
+            source_index,
+            lon,
+            lat,
+            source_cs.as_cartopy_crs(),
+            target_proj,
+            target_x,
+            target_y,
+        )
+        index = np.where(np.ma.getmaskarray(target_index), -1, target_index)
+        helpers.cache.save_array(cache_name, index, "projection index")
+    index = np.asarray(index)
+    mask = index < 0
+    _projection_indices[cache_name] = (np.where(mask, 0, index), mask)
+    return _projection_indices[cache_name]
@@ -1,13 +1,18 @@
 """Helper module for NEMO data."""
 
+import hashlib
 import warnings
+from pathlib import Path
 
-import iris
+import dask.array as da
+import netCDF4
 import numpy as np
 from iris.analysis import WeightedAggregator
-from iris.coords import CellMeasure
 from iris.exceptions import CoordinateNotFoundError
 
+import helpers.cache
+import helpers.cubes
+
 _nemo_horizontal_coords = (
     "latitude",
     "longitude",
@@ -59,39 +64,67 @@ def has_depth(cube):
     return len(tuple(depth_coords(cube))) > 0
 
 
-def _add_cell_size(cube, domain_file, grid):
-    """Compute cell weights for spatial averaging in 2d and 3d"""
-    domain = iris.load(domain_file)
-    e1, e2 = (  # NEMO grid scale factors in horizontal directions
-        domain.extract(f"e1{grid.lower()}")[0][0],
-        domain.extract(f"e2{grid.lower()}")[0][0],
+def _read_scale_factors(domain_file, names):
+    """Return the product of NEMO grid scale factors from the domain file."""
+    with netCDF4.Dataset(str(domain_file)) as domain:
+        product = np.ones((), dtype=np.float64)
+        for name in names:
+            product = product * np.ma.filled(domain.variables[name][0], 0.0)
+    return product.astype(np.float32)
+
+
+def _cached_scale_factors(domain_file, names):
+    """
+    Return the product of scale factors, computed once and then read from the
+    cache, keyed by a hash of the domain file's path, size and modification time.
+    """
+    domain_file = Path(domain_file).expanduser().resolve()
+    stat = domain_file.stat()
+    domain_hash = hashlib.sha1(
+        f"{domain_file}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()
+    cache_name = f"scale_factors_{domain_hash}_{'_'.join(names)}.npy"
+    product = helpers.cache.load_array(cache_name)
+    if product is None:
+        product = _read_scale_factors(domain_file, names)
+        helpers.cache.save_array(cache_name, product, "NEMO scale factors")
+    return product
+
+
+def cell_weights(domain_file, grid, is_3d):
+    """
+    Return the NEMO cell area (2d) or volume (3d) weights from the domain file.
+
+    The horizontal (e1 * e2) and vertical (e3) scale factors are stored in
+    float32 as .npy files in the cache directory (ECE_MONITORING_CACHE_DIR,
+    default ~/.cache/ece-monitoring). Later calls, from other tasks or legs,
+    memory-map the stored arrays. The volume is their lazy (Dask) product, so
+    that it is computed one block at a time where the data is reduced.
+    """
+    area = _cached_scale_factors(
+        domain_file, (f"e1{grid.lower()}", f"e2{grid.lower()}")
     )
-    is_3d = has_depth(cube)
-    if is_3d:
-        e3 = domain.extract(f"e3{grid.lower()}_0")[0][0]
-    weights = e1 * e2 * e3 if is_3d else e1 * e2
-    weights = np.broadcast_to(weights.data, cube.shape)
-    if is_3d:
-        cell_size = CellMeasure(
-            weights, var_name="cell_size", units="m3", measure="volume"
-        )
-    else:
-        cell_size = CellMeasure(
-            weights, var_name="cell_size", units="m2", measure="area"
-        )
-    dims = tuple(range(len(weights.shape)))
-    cube.add_cell_measure(cell_size, dims)
-
+    if not is_3d:
+        return area
+    thickness = _cached_scale_factors(domain_file, (f"e3{grid.lower()}_0",))
+    return da.from_array(thickness, chunks=(1, *thickness.shape[1:])) * area
 
-def remove_unique_attributes(cube):
-    drop = ("uuid", "timeStamp")  # these are unique for each NEMO file
-    for attribute in drop:
-        cube.attributes.pop(attribute, None)
-    return cube
 
+def compute_global_aggregate(
+    cube, domain, grid, operation: WeightedAggregator, levels_per_block=None
+):
+    """
+    Compute a global aggregate, weighted with the NEMO cell size.
 
-def compute_global_aggregate(cube, domain, grid, operation: WeightedAggregator):
-    _add_cell_size(cube, domain, grid)
+    For 3d variables, levels_per_block reads and reduces the data in blocks of
+    that many depth levels, to bound memory for large grids.
+    """
+    is_3d = has_depth(cube)
+    weights = cell_weights(domain, grid, is_3d)
+    coords = list(spatial_coords(cube))
+    block_dim = None
+    if is_3d and levels_per_block:
+        (block_dim,) = cube.coord_dims(depth_coord(cube))
     with warnings.catch_warnings():
         # Suppress warning about insufficient metadata.
         warnings.filterwarnings(
@@ -99,9 +132,13 @@ def compute_global_aggregate(cube, domain, grid, operation: WeightedAggregator):
             "Collapsing a multi-dimensional coordinate.",
             UserWarning,
         )
-        global_aggregate = cube.collapsed(
-            spatial_coords(cube),
+        global_aggregate = helpers.cubes.weighted_aggregate(
+            cube,
+            coords,
+            weights,
             operation,
-            weights="cell_size",
+            block_dim=block_dim,
+            block_size=levels_per_block or 1,
+            weights_units="m3" if is_3d else "m2",
         )
     return global_aggregate
@@ -0,0 +1,272 @@
+"""Helper module for reading and in-place updates of netCDF diagnostics on disk."""
+
+import math
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import cf_units
+import iris.coords
+import netCDF4
+
+# netCDF attributes that Iris handles itself when creating a coordinate
+_structural_attributes = (
+    "units",
+    "calendar",
+    "bounds",
+    "climatology",
+    "axis",
+    "standard_name",
+    "long_name",
+    "_FillValue",
+)
+
+# Upper bound for the records that are moved at once when inserting
+_move_block_bytes = 64 * 2**20
+
+# Variable that counts how often each record of a temporal map was replaced
+record_revision_name = "record_revision"
+
+
+def diagnostic_attributes(path):
+    """
+    Return the attributes of a diagnostic from the netCDF header, without
+    reading any data: the global attributes, and those of the data variable
+    if Iris stored the diagnostic attributes there.
+    """
+    with netCDF4.Dataset(str(path)) as dataset:
+        attributes = {name: dataset.getncattr(name) for name in dataset.ncattrs()}
+        for variable in dataset.variables.values():
+            if "diagnostic_type" in variable.ncattrs():
+                attributes.update(
+                    {name: variable.getncattr(name) for name in variable.ncattrs()}
+                )
+    return attributes
+
+
+def unlimited_dimension(path):
+    """Return the name of the unlimited dimension in a netCDF file, or None."""
+    with netCDF4.Dataset(str(path)) as dataset:
+        for name, dimension in dataset.dimensions.items():
+            if dimension.isunlimited():
+                return name
+    return None
+
+
+def append_records(src, dst, dimension):
+    """
+    Append all records along an unlimited dimension from src to dst.
+
+    Only variables that span the dimension (data, coordinate, bounds, ...) are
+    written, the rest of dst is left untouched. Both files must have the same
+    variable layout, which is the case if Iris wrote them from cubes that
+    concatenate along the dimension. Raises ValueError if the names, units or
+    shapes of these variables differ, before anything is written.
+    """
+    _write_records(src, dst, dimension, index=None, insert=True)
+
+
+def insert_records(src, dst, dimension, index):
+    """
+    Insert all records along an unlimited dimension from src into dst, before
+    the record at index. Same as append_records otherwise.
+
+    Moving records back in place would leave dst corrupt if interrupted, so
+    they are inserted into a copy of dst, which then replaces it. Copying costs
+    disk I/O of the order of the file size; only the records from index on are
+    moved, in blocks of bounded size, so that memory use does not grow with
+    the file.
+    """
+    dst = Path(dst)
+    fd, dst_copy = tempfile.mkstemp(
+        prefix=f".{dst.stem}_", suffix=dst.suffix, dir=dst.parent
+    )
+    os.close(fd)
+    try:
+        shutil.copy2(dst, dst_copy)
+        _write_records(src, dst_copy, dimension, index=index, insert=True)
+        os.replace(dst_copy, dst)
+    except BaseException:
+        os.unlink(dst_copy)
+        raise
+
+
+def replace_records(src, dst, dimension):
+    """
+    Overwrite the last records along a dimension in dst with all records from
+    src, e.g. with those of a leg that was run again. Same as append_records
+    otherwise.
+    """
+    _write_records(src, dst, dimension, index=None, insert=False)
+
+
+def _write_records(src, dst, dimension, index, insert):
+    with netCDF4.Dataset(str(src)) as src_ds:
+        with netCDF4.Dataset(str(dst), "a") as dst_ds:
+            record_vars = [
+                name
+                for name, var in dst_ds.variables.items()
+                if dimension in var.dimensions
+            ]
+            if dimension not in src_ds.dimensions:
+                raise ValueError(f"Dimension '{dimension}' not found in {src}")
+            missing = [name for name in record_vars if name not in src_ds.variables]
+            if missing:
+                raise ValueError(f"Variables {missing} not found in {src}")
+            # only the records are written, so the rest must match dst already
+            for name in record_vars:
+                _check_header(src_ds.variables[name], dst_ds.variables[name], dimension)
+
+            size = dst_ds.dimensions[dimension].size
+            count = src_ds.dimensions[dimension].size
+            if not insert:
+                if count > size:
+                    raise ValueError(f"Less than {count} records in {dst}")
+                index = size - count
+            elif index is None:
+                index = size
+            elif not 0 <= index <= size:
+                raise ValueError(f"Record {index} out of range in {dst}")
+            for name in record_vars:
+                dst_var = dst_ds.variables[name]
+                axis = dst_var.dimensions.index(dimension)
+                if insert and index < size:
+                    _move_records(dst_var, axis, index, size, count)
+                dst_var[_records(dst_var, axis, index, index + count)] = (
+                    src_ds.variables[name][:]
+                )
+
+
+def _check_header(src_var, dst_var, dimension):
+    """Raise ValueError if the records of src_var do not fit into dst_var"""
+    if src_var.dimensions != dst_var.dimensions:
+        raise ValueError(
+            f"Dimensions {src_var.dimensions} of '{src_var.name}' differ from "
+            f"{dst_var.dimensions}"
+        )
+    src_shape = [n for d, n in zip(src_var.dimensions, src_var.shape) if d != dimension]
+    dst_shape = [n for d, n in zip(dst_var.dimensions, dst_var.shape) if d != dimension]
+    if src_shape != dst_shape:
+        raise ValueError(
+            f"Shape {src_shape} of '{src_var.name}' differs from {dst_shape}"
+        )
+    for attribute in ("standard_name", "units"):
+        src_value = getattr(src_var, attribute, None)
+        dst_value = getattr(dst_var, attribute, None)
+        if src_value == dst_value:
+            continue
+        if attribute == "units" and _same_units(src_value, dst_value):
+            continue
+        raise ValueError(
+            f"{attribute} '{src_value}' of '{src_var.name}' differs from '{dst_value}'"
+        )
+
+
+def _same_units(first, second):
+    """True if both are equal units, e.g. 'K' and 'kelvin'"""
+    try:
+        return cf_units.Unit(first) == cf_units.Unit(second)
+    except (TypeError, ValueError):
+        return False
+
+
+def _move_records(var, axis, start, stop, count):
+    """
+    Move the records from start to stop back by count, growing the dimension.
+    The blocks are moved from the end, so none is overwritten before it moved.
+    """
+    record_size = var.dtype.itemsize * math.prod(
+        n for i, n in enumerate(var.shape) if i != axis
+    )
+    block = max(1, _move_block_bytes // max(record_size, 1))
+    for end in range(stop, start, -block):
+        begin = max(start, end - block)
+        var[_records(var, axis, begin + count, end + count)] = var[
+            _records(var, axis, begin, end)
+        ]
+
+
+def _records(var, axis, start, stop):
+    """Index of the records from start to stop along axis of a variable"""
+    index = [slice(None)] * var.ndim
+    index[axis] = slice(start, stop)
+    return tuple(index)
+
+
+def last_record_coord(path, dimension, count=1):
+    """
+    Return the coordinate of the last count records along a dimension as Iris
+    DimCoord.
+
+    Only the last points and bounds are read, which makes it cheap to check
+    new records against the stored ones without loading the whole file.
+    """
+    return _record_coord(path, dimension, slice(-count, None))
+
+
+def record_coord(path, dimension):
+    """
+    Return the coordinate of all records along a dimension as Iris DimCoord.
+
+    Only the coordinate and its bounds are read, as an index to find where new
+    records belong, without loading the data.
+    """
+    return _record_coord(path, dimension, slice(None))
+
+
+def _record_coord(path, dimension, records):
+    with netCDF4.Dataset(str(path)) as dataset:
+        dataset.set_auto_mask(False)
+        var = dataset.variables[dimension]
+        attributes = {name: var.getncattr(name) for name in var.ncattrs()}
+        bounds_name = attributes.get("bounds", attributes.get("climatology"))
+        bounds = dataset.variables[bounds_name][records] if bounds_name else None
+        coord = iris.coords.DimCoord(
+            var[records],
+            standard_name=attributes.get("standard_name"),
+            long_name=attributes.get("long_name"),
+            var_name=dimension,
+            units=cf_units.Unit(
+                attributes.get("units", "1"), calendar=attributes.get("calendar")
+            ),
+            bounds=bounds,
+            attributes={
+                name: value
+                for name, value in attributes.items()
+                if name not in _structural_attributes
+            },
+            climatological="climatology" in attributes,
+        )
+    return coord
+
+
+def coord_points(path, standard_name):
+    """
+    Return the points and units of the coordinate with the given standard name.
+
+    Only the coordinate variable is read, so that the records of a diagnostic
+    can be inspected without loading its data.
+    """
+    with netCDF4.Dataset(str(path)) as dataset:
+        dataset.set_auto_mask(False)
+        for var in dataset.variables.values():
+            if var.ndim == 1 and getattr(var, "standard_name", None) == standard_name:
+                return var[:], getattr(var, "units", "1")
+    raise ValueError(f"No {standard_name} coordinate found in {path}")
+
+
+def record_revisions(path, dimension):
+    """
+    Return the revision of each record along a dimension, or None if the file
+    does not count revisions.
+
+    Temporal maps count how often each record was replaced, so that a replaced
+    record can be told from an unchanged one by reading only this variable.
+    """
+    with netCDF4.Dataset(str(path)) as dataset:
+        dataset.set_auto_mask(False)
+        var = dataset.variables.get(record_revision_name)
+        if var is None or var.dimensions != (dimension,):
+            return None
+        return var[:]
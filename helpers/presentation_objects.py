@@ -2,24 +2,39 @@
 Initialize presentation objects for visualization
 """
 
+import concurrent.futures
+import functools
+import importlib.metadata
+import json
+import os
 from pathlib import Path
 from textwrap import wrap
 
 import cftime
-import imageio.v3 as imageio
+import dask
 import iris
 import iris.quickplot as qplt
 import matplotlib.pyplot as plt
+import numpy as np
 import yaml
+from PIL import GifImagePlugin, Image
 
+import helpers.cache
+import helpers.netcdf
 from helpers.exceptions import InvalidMapTypeException, PresentationException
-from helpers.files import ChangeDirectory
-from helpers.map_type_handling import function_mapper
+from helpers.map_type_handling import MapRenderer, function_mapper
+
+try:
+    # part of the render cache keys, so that plots are redone after updates
+    _package_version = importlib.metadata.version("scriptengine-tasks-ecearth")
+except importlib.metadata.PackageNotFoundError:  # not installed
+    _package_version = None
 
 
 class PresentationObject:
     def __init__(self, dst_folder, path, **kwargs):
-        self.dst_folder = Path(dst_folder)
+        # absolute, so that output does not depend on the working directory
+        self.dst_folder = Path(dst_folder).expanduser().resolve()
         self.path = Path(path)
         self.custom_input = kwargs
         self.loader = get_loader(self.path)
@@ -29,13 +44,57 @@ class PresentationObject:
         return {"presentation_type": self.loader.pres_type, **loaded_dict}
 
 
+def create_dicts(sources, dst_folder, workers=1):
+    """
+    Create the presentation dicts of all sources, in the order of sources.
+
+    A source is a path or a dict with the path and custom visualization
+    options. With more than one worker, the sources are loaded and plotted by
+    a pool of worker processes. The result for a source that can not be
+    presented is its PresentationException, to be reported by the caller.
+    """
+    workers = min(workers or available_cpus(), len(sources))
+    if workers <= 1:
+        return [_create_dict(src, dst_folder) for src in sources]
+    with concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(True,)
+    ) as executor:
+        return list(executor.map(_create_dict, sources, [dst_folder] * len(sources)))
+
+
+def _create_dict(src, dst_folder):
+    try:
+        try:
+            pres_object = PresentationObject(dst_folder, **src)
+        except TypeError:
+            pres_object = PresentationObject(dst_folder, src)
+        return pres_object.create_dict()
+    except PresentationException as error:
+        return error
+
+
+# Default number of processes rendering the frames of a temporal map, all CPUs
+# if None. Processes that already present diagnostics in parallel use one.
+_frame_workers = None
+
+
+def _init_worker(render_frames_serially=False):
+    """
+    Initialize a worker process. Dask computes in the main thread of the
+    worker, as the thread pool of the parent process does not survive the fork.
+    """
+    dask.config.set(scheduler="synchronous")
+    if render_frames_serially:
+        global _frame_workers
+        _frame_workers = 1
+
+
 def get_loader(path):
     if path.suffix in (".yml", ".yaml"):
         return ScalarLoader(path)
     if path.suffix == ".nc":
         try:
-            # Iris before 3.3 can't handle pathlib's Path, needs string
-            cube = iris.load_cube(str(path))
+            attributes = helpers.netcdf.diagnostic_attributes(path)
         except OSError:
             raise PresentationException(f"File not found: {path}")
         loader_map = {
@@ -43,9 +102,9 @@ def get_loader(path):
             "map": MapLoader,
             "temporal map": TemporalmapLoader,
         }
-        diag_type = cube.attributes["diagnostic_type"]
+        diag_type = attributes.get("diagnostic_type")
         try:
-            return loader_map[diag_type](path, cube)
+            return loader_map[diag_type](path, attributes)
         except KeyError:
             raise PresentationException(f"Invalid diagnostic type: {diag_type}")
     raise PresentationException(f"Invalid file extension: {path}")
@@ -60,6 +119,12 @@ class PresentationObjectLoader:
     def load(self, **kwargs):
         raise NotImplementedError
 
+    def render_key(self, **kwargs):
+        """Cache key for the plot of this diagnostic with the given options"""
+        return helpers.cache.render_key(
+            self.path, type(self).__name__, _package_version, **kwargs
+        )
+
 
 class ScalarLoader(PresentationObjectLoader):
     def __init__(self, path):
@@ -76,18 +141,43 @@ class ScalarLoader(PresentationObjectLoader):
             raise PresentationException(f"File not found: {self.path}")
 
 
-class TimeseriesLoader(PresentationObjectLoader):
-    def __init__(self, path, cube):
+class CubeLoader(PresentationObjectLoader):
+    """
+    Base class for netCDF diagnostics. The attributes are read from the file
+    header, the cube is only loaded (with lazy data) when it is plotted.
+    """
+
+    def __init__(self, path, attributes):
         self.path = Path(path)
-        self.cube = cube
+        self.attributes = attributes
+
+    @functools.cached_property
+    def cube(self):
+        # Iris before 3.3 can't handle pathlib's Path, needs string
+        return iris.load_cube(str(self.path))
+
+
+class TimeseriesLoader(CubeLoader):
+    def __init__(self, path, attributes):
+        super().__init__(path, attributes)
         self.diag_type = "time series"
         self.pres_type = "image"
 
     def load(self, dst_folder, **kwargs):
         """
         Load time series diagnostic and call plot creator.
+
+        Plots of unchanged diagnostics are copied from the render cache.
         """
+        dst_folder = Path(dst_folder)
         dst_file = f"./{self.path.stem}.png"
+        render_key = self.render_key(**kwargs)
+        if helpers.cache.load_render(render_key, dst_folder / dst_file):
+            return {
+                "title": self.attributes["title"],
+                "path": dst_file,
+                "comment": self.attributes["comment"],
+            }
 
         x_coord = self.cube.coords()[0]
         if "second since" in x_coord.units.name or "hour since" in x_coord.units.name:
@@ -136,14 +226,14 @@ class TimeseriesLoader(PresentationObjectLoader):
         ax.set_ylabel(format_label(self.cube.long_name, self.cube.units))
 
         plt.tight_layout()
-        with ChangeDirectory(dst_folder):
-            fig.savefig(dst_file, bbox_inches="tight")
-            plt.close(fig)
+        fig.savefig(dst_folder / dst_file, bbox_inches="tight")
+        plt.close(fig)
+        helpers.cache.save_render(render_key, dst_folder / dst_file)
 
         return {
-            "title": self.cube.attributes["title"],
+            "title": self.attributes["title"],
             "path": dst_file,
-            "comment": self.cube.attributes["comment"],
+            "comment": self.attributes["comment"],
         }
 
     def _determine_intervals(self, coord_length):
@@ -162,22 +252,33 @@ class TimeseriesLoader(PresentationObjectLoader):
             return 10, 20
 
 
-class MapLoader(PresentationObjectLoader):
-    def __init__(self, path, cube):
-        self.path = Path(path)
-        self.cube = cube
+class MapLoader(CubeLoader):
+    def __init__(self, path, attributes):
+        super().__init__(path, attributes)
         self.diag_type = "map"
         self.pres_type = "image"
 
     def load(self, dst_folder, **kwargs):
         """
         Load map diagnostic and determine map type.
+
+        Plots of unchanged diagnostics are copied from the render cache.
         """
-        map_type = self.cube.attributes["map_type"]
+        map_type = self.attributes["map_type"]
         map_handler = function_mapper(map_type)
         if map_handler is None:
             raise InvalidMapTypeException(map_type)
 
+        dst_folder = Path(dst_folder)
+        dst_file = f"./{self.path.stem}.png"
+        render_key = self.render_key(**kwargs)
+        if helpers.cache.load_render(render_key, dst_folder / dst_file):
+            return {
+                "title": self.attributes["title"],
+                "path": dst_file,
+                "comment": self.attributes["comment"],
+            }
+
         unit_text = format_units(self.cube.units)
         time_coord = self.cube.coord("time")
         time_bounds = time_coord.bounds[0]
@@ -191,65 +292,322 @@ class MapLoader(PresentationObjectLoader):
             units=unit_text,
             **kwargs,
         )
-        dst_file = f"./{self.path.stem}.png"
-        with ChangeDirectory(dst_folder):
-            fig.savefig(dst_file, bbox_inches="tight")
-            plt.close(fig)
+        fig.savefig(dst_folder / dst_file, bbox_inches="tight")
+        plt.close(fig)
+        helpers.cache.save_render(render_key, dst_folder / dst_file)
 
         return {
-            "title": self.cube.attributes["title"],
+            "title": self.attributes["title"],
             "path": dst_file,
-            "comment": self.cube.attributes["comment"],
+            "comment": self.attributes["comment"],
         }
 
 
-class TemporalmapLoader(PresentationObjectLoader):
-    def __init__(self, path, cube):
-        self.path = Path(path)
-        self.cube = cube
+class TemporalmapLoader(CubeLoader):
+    def __init__(self, path, attributes):
+        super().__init__(path, attributes)
         self.diag_type = "temporal map"
         self.pres_type = "image"
 
-    def load(self, dst_folder, **kwargs):
+    def load(
+        self,
+        dst_folder,
+        workers=None,
+        animation_format="gif",
+        frame_rate=2,
+        max_frame_size=None,
+        **kwargs,
+    ):
         """
         Load map diagnostic and determine map type.
+
+        Rendered frames are tracked in a manifest in the frames folder, which
+        maps the time points and the revisions of their records to PNG files.
+        Only these are read to find new or replaced records, and only their
+        slices of the diagnostic are loaded. New frames are rendered in
+        parallel by a pool of worker processes, by default as many as CPUs are
+        available, each drawing its frames into one reused figure. For GIF
+        output, only the new frames are encoded and appended to the existing
+        GIF. Video (mp4, webm) and animated WebP output is encoded from all
+        frames through a streaming writer.
         """
-        map_type = self.cube.attributes["map_type"]
+        map_type = self.attributes["map_type"]
         map_handler = function_mapper(map_type)
         if map_handler is None:
             raise InvalidMapTypeException(map_type)
+        if animation_format != "gif" and animation_format not in _video_codecs:
+            raise PresentationException(f"Invalid animation format: {animation_format}")
 
+        dst_folder = Path(dst_folder)
         png_dir = dst_folder / Path(self.path.stem + "_frames")
         png_dir.mkdir(exist_ok=True)
-        num_existing_pngs = len(list(png_dir.iterdir()))
 
-        gif_file = self.path.with_suffix(".gif").name
+        animation_file = self.path.with_suffix(f".{animation_format}").name
 
-        time = self.cube.coord("time")
-        dates = [cftime.num2pydate(t, time.units.name) for t in time.points]
+        # only the time coordinate is read to find the frames to be rendered
+        try:
+            time_points, time_units = helpers.netcdf.coord_points(self.path, "time")
+        except ValueError as error:
+            raise PresentationException(error)
+        dates = cftime.num2pydate(time_points, time_units)
         num_months = len(set(d.month for d in dates))
 
-        for ts in range(num_existing_pngs, len(dates)):
-            fig = map_handler(
-                self.cube[ts],
-                title=format_title(self.cube.long_name),
-                dates=dates[ts].strftime("%B %Y" if num_months > 1 else "%Y"),
-                units=format_units(self.cube.units),
-                **kwargs,
+        # frames are keyed by the time and the revision of their record, which
+        # counts replacements, so that replaced records are rendered again
+        revisions = helpers.netcdf.record_revisions(self.path, "time")
+        if revisions is None:
+            revisions = [0] * len(time_points)
+        time_keys = [_frame_key(t, rev) for t, rev in zip(time_points, revisions)]
+        manifest = _read_frame_manifest(png_dir, self.path.stem, time_keys)
+        for key in set(manifest) - set(time_keys):  # frames of replaced records
+            (png_dir / manifest.pop(key)).unlink(missing_ok=True)
+        new_steps = [ts for ts, key in enumerate(time_keys) if key not in manifest]
+        # frames before the first new one are already encoded in the animation
+        num_encoded = new_steps[0] if new_steps else len(time_keys)
+
+        new_frames = []
+        if new_steps:
+            title = format_title(self.cube.long_name)
+            units = format_units(self.cube.units)
+        for ts in new_steps:
+            png_file = _new_frame_file(png_dir, self.path.stem, ts, manifest)
+            new_frames.append(
+                (
+                    self.cube[ts],
+                    title,
+                    dates[ts].strftime("%B %Y" if num_months > 1 else "%Y"),
+                    units,
+                    png_dir / png_file,
+                )
             )
-            fig.savefig(png_dir / f"{self.path.stem}-{ts:03}.png", bbox_inches="tight")
-            plt.close(fig)
+            manifest[time_keys[ts]] = png_file
+
+        workers = min(workers or _frame_workers or available_cpus(), len(new_frames))
+        if workers > 1:
+            # each worker renders every n-th frame into its own figure
+            batches = [new_frames[w::workers] for w in range(workers)]
+            with concurrent.futures.ProcessPoolExecutor(
+                workers, initializer=_init_worker
+            ) as executor:
+                # consume the results to raise exceptions from the workers
+                list(
+                    executor.map(
+                        _render_frames,
+                        [map_type] * workers,
+                        batches,
+                        [kwargs] * workers,
+                    )
+                )
+        elif new_frames:
+            _render_frames(map_type, new_frames, kwargs)
+        _write_frame_manifest(png_dir, manifest)
 
-        frames = [imageio.imread(png) for png in sorted(png_dir.iterdir())]
-        imageio.imwrite(dst_folder / gif_file, frames, duration=500, loop=0)
+        png_files = [png_dir / manifest[key] for key in time_keys]
+        frame_size = _animation_frame_size(
+            png_files[0], max_frame_size, even=animation_format != "gif"
+        )
+        if animation_format == "gif":
+            _write_gif(
+                dst_folder / animation_file,
+                png_files,
+                num_encoded,
+                frame_size,
+                duration=1000 / frame_rate,
+            )
+        else:
+            _write_video(dst_folder / animation_file, png_files, frame_size, frame_rate)
 
         return {
-            "title": self.cube.attributes["title"],
-            "comment": self.cube.attributes["comment"],
-            "path": "./" + gif_file,
+            "title": self.attributes["title"],
+            "comment": self.attributes["comment"],
+            "path": "./" + animation_file,
         }
 
 
+def _render_frames(map_type, frames, kwargs):
+    """
+    Render frames of a temporal map into one reused figure, in a worker
+    process if parallel.
+    """
+    renderer = MapRenderer(map_type, **kwargs)
+    try:
+        for cube, title, dates, units, png_file in frames:
+            fig = renderer.render(cube, title=title, dates=dates, units=units)
+            fig.savefig(png_file, bbox_inches="tight")
+    finally:
+        renderer.close()
+
+
+_frame_manifest = "frames.json"
+
+
+def _frame_key(time_point, revision):
+    if revision:
+        return f"{float(time_point)}:{revision}"
+    return str(float(time_point))
+
+
+def _read_frame_manifest(png_dir, stem, time_keys):
+    """
+    Return the manifest of rendered frames, mapping frame keys to PNG files.
+
+    Frame directories from before the manifest hold one PNG per time step,
+    numbered in order, which are taken over for the existing time steps.
+    """
+    try:
+        with open(png_dir / _frame_manifest) as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        manifest = {
+            key: f"{stem}-{ts:03}.png"
+            for ts, key in enumerate(time_keys)
+            if (png_dir / f"{stem}-{ts:03}.png").exists()
+        }
+    except (OSError, ValueError):
+        return {}
+    # frames that were removed since are rendered again
+    return {
+        key: png_file
+        for key, png_file in manifest.items()
+        if (png_dir / png_file).exists()
+    }
+
+
+def _write_frame_manifest(png_dir, manifest):
+    with open(png_dir / _frame_manifest, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=0)
+
+
+def _new_frame_file(png_dir, stem, ts, manifest):
+    """PNG file name for a new frame at time step ts, not used by other frames"""
+    used = set(manifest.values())
+    while f"{stem}-{ts:03}.png" in used:
+        ts += 1
+    return f"{stem}-{ts:03}.png"
+
+
+_video_codecs = {"mp4": "h264", "webm": "vp9", "webp": "webp"}
+
+
+def _animation_frame_size(png_file, max_frame_size=None, even=False):
+    """
+    Size of the animation frames: the size of the first frame, scaled down so
+    that its longer side fits max_frame_size. Video codecs need even sizes.
+    """
+    with Image.open(png_file) as image:
+        width, height = image.size
+    if max_frame_size and max(width, height) > max_frame_size:
+        scale = max_frame_size / max(width, height)
+        width, height = round(width * scale), round(height * scale)
+    if even:
+        width, height = width - width % 2, height - height % 2
+    return max(width, 2), max(height, 2)
+
+
+def _animation_frame(png_file, size):
+    with Image.open(png_file) as image:
+        frame = image.convert("RGB")
+    if frame.size != size:
+        frame = frame.resize(size, Image.Resampling.LANCZOS)
+    return frame
+
+
+def _gif_frame(png_file, size):
+    return _animation_frame(png_file, size).convert("P", palette=Image.Palette.ADAPTIVE)
+
+
+def _write_gif(gif_file, png_files, num_encoded, size, duration=500):
+    """
+    Write an animated GIF from PNG frames, encoding one frame at a time.
+
+    If gif_file already holds the first num_encoded frames, only the remaining
+    PNG files are appended to it. Otherwise the GIF is rebuilt from all frames.
+    """
+    if num_encoded and _count_gif_frames(gif_file) == num_encoded:
+        new_pngs = png_files[num_encoded:]
+    else:
+        _gif_frame(png_files[0], size).save(gif_file, duration=duration, loop=0)
+        new_pngs = png_files[1:]
+    if not new_pngs:
+        return
+    with open(gif_file, "r+b") as gif:
+        gif.seek(-1, os.SEEK_END)  # overwrite the trailer
+        for png in new_pngs:
+            for data in GifImagePlugin.getdata(
+                _gif_frame(png, size), duration=duration, include_color_table=True
+            ):
+                gif.write(data)
+        gif.write(b";")
+
+
+def _write_video(video_file, png_files, size, frame_rate):
+    """
+    Encode PNG frames as video or animated WebP with PyAV, one frame at a time.
+    """
+    import imageio.v3 as imageio  # only needed for video output
+
+    animation_format = video_file.suffix[1:]
+    # the WebP muxer plays the animation only once by default
+    options = {"loop": "0"} if animation_format == "webp" else {}
+    try:
+        video = imageio.imopen(video_file, "w", plugin="pyav", options=options)
+    except ImportError as error:
+        raise PresentationException(f"Can not write {video_file.name}: {error}")
+    with video:
+        video.init_video_stream(_video_codecs[animation_format], fps=frame_rate)
+        for png in png_files:
+            video.write_frame(np.asarray(_animation_frame(png, size)))
+
+
+def _count_gif_frames(gif_file):
+    """
+    Count the frames of a GIF file by skipping through its blocks, without
+    decoding them. Returns None if the file is missing or not a complete GIF.
+    """
+    try:
+        gif = open(gif_file, "rb")
+    except OSError:
+        return None
+    with gif:
+        header = gif.read(13)
+        if len(header) < 13 or header[:3] != b"GIF":
+            return None
+        if header[10] & 0x80:  # global color table
+            gif.seek(3 << ((header[10] & 0x07) + 1), os.SEEK_CUR)
+        frames = 0
+        while True:
+            block = gif.read(1)
+            if block == b";":  # trailer, must be the end of the file
+                return frames if not gif.read(1) else None
+            if block == b"!":  # extension
+                gif.read(1)
+            elif block == b",":  # image descriptor
+                descriptor = gif.read(9)
+                if len(descriptor) < 9:
+                    return None
+                if descriptor[8] & 0x80:  # local color table
+                    gif.seek(3 << ((descriptor[8] & 0x07) + 1), os.SEEK_CUR)
+                gif.read(1)  # LZW minimum code size
+                frames += 1
+            else:
+                return None
+            # skip the data sub-blocks
+            while size := gif.read(1):
+                if size == b"\0":
+                    break
+                gif.seek(size[0], os.SEEK_CUR)
+            else:
+                return None
+
+
+def available_cpus():
+    """Number of CPUs available to this process, e.g. restricted by the batch job"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on all platforms
+        return os.cpu_count() or 1
+
+
 def format_title(name):
     """
     String formatting for plot titles
@@ -1,10 +1,12 @@
 """Base class for map processing tasks."""
 
+import functools
 from pathlib import Path
-from tempfile import NamedTemporaryFile
 
 import iris
+import iris.coords
 import iris.cube
+import numpy as np
 from scriptengine.exceptions import (
     ScriptEngineTaskArgumentInvalidError,
     ScriptEngineTaskRunError,
@@ -13,18 +15,67 @@ from scriptengine.tasks.core import Task
 
 import helpers.cubes
 
+_time_weights_name = "sum_of_time_weights"
+_time_mean_name = "time_weighted_mean"
+# The map before the last leg is kept as ancillary variables, so that the last
+# leg can be replaced if it is run again
+_previous_map_name = "map_before_last_leg"
+_previous_suffix = "_before_last_leg"
+
+# Streaming statistics that can be saved next to the simulation average,
+# with their CF cell method names
+_statistics = {
+    "std": "standard_deviation",
+    "min": "minimum",
+    "max": "maximum",
+}
+
 
 class Map(Task):
     """Map Processing Task"""
 
-    def save(self, new_cube: iris.cube.Cube, dst: Path):
+    def save(self, new_cube: iris.cube.Cube, dst: Path, replace_overlap=False):
         """save map cube in netCDF file"""
         self.log_debug(f"Saving map cube to '{dst}'")
         new_cube.attributes["diagnostic_type"] = "map"
+        self.update_file(new_cube, dst, self.update_simulation_avg, replace_overlap)
+
+    def save_statistics(
+        self, new_cube: iris.cube.Cube, statistics: dict, replace_overlap=False
+    ):
+        """
+        save streaming statistics of the leg maps in netCDF files
+
+        statistics maps the statistic ("std", "min", "max") to its destination.
+        Like the simulation average, each statistic is updated with the new leg
+        only, in O(field) per leg.
+        """
+        for statistic, dst in statistics.items():
+            self.log_debug(f"Saving {statistic} map cube to '{dst}'")
+            stat_cube = new_cube.copy()
+            stat_cube.attributes["diagnostic_type"] = "map"
+            self.update_file(
+                stat_cube,
+                Path(dst),
+                functools.partial(self.update_statistic, statistic=statistic),
+                replace_overlap,
+            )
+
+    def update_file(
+        self, new_cube: iris.cube.Cube, dst: Path, update, replace_overlap=False
+    ):
+        """
+        update the map in dst with a new leg, using update(current, new)
+
+        With replace_overlap, the map before the new leg is stored with it, and
+        a leg that ends with the current map, e.g. a leg that is run again,
+        replaces the last leg: the update is made again from the stored map
+        before it. Maps saved without it can not be updated like this.
+        """
         try:
             current_cube = iris.load_cube(str(dst))
         except OSError:  # file does not exist yet.
-            iris.save(new_cube, str(dst))
+            iris.save(update(None, new_cube), str(dst))
             return
 
         # align the time coordinates of current and new cube.
@@ -33,26 +84,33 @@ class Map(Task):
 
         current_bounds = current_cube.coord("time").bounds
         new_bounds = new_cube.coord("time").bounds
-        if current_bounds[-1][-1] > new_bounds[0][0]:
+        if replace_overlap and np.isclose(
+            current_bounds[-1][-1], new_bounds[-1][-1], rtol=1e-9
+        ):
+            if np.isclose(current_bounds[0][0], new_bounds[0][0], rtol=1e-9):
+                previous_cube = None  # the map holds only this leg
+            else:
+                previous_cube = _previous_cube(current_cube)
+                if previous_cube is None:
+                    self.log_error(
+                        f"Cannot replace the last leg of '{dst}', "
+                        "the map before it is not stored."
+                    )
+                    raise ScriptEngineTaskRunError()
+            self.log_warning(f"Replacing the last leg of '{dst}'")
+        elif current_bounds[-1][-1] > new_bounds[0][0]:
             msg = "Non-monotonic coordinate. Cube will not be saved."
             self.log_error(msg)
             raise ScriptEngineTaskRunError()
+        else:
+            previous_cube = current_cube
 
-        # Iris changes metadata when saving/loading cube
-        # save & reload to prevent metadata mismatch
-        # keep tempfile until the merged cube is saved
-        with NamedTemporaryFile() as tf:
-            iris.save(new_cube, tf.name, saver="nc")
-            new_cube = iris.load_cube(tf.name)
-
-            current_cube.cell_methods = new_cube.cell_methods
-            cube_list = iris.cube.CubeList([current_cube, new_cube])
-            merged_cube = cube_list.merge_cube()
-            simulation_avg = self.compute_simulation_avg(merged_cube)
-
-            dst_copy = dst.with_name(f"{dst.stem}_copy{dst.suffix}")
-            iris.save(simulation_avg, str(dst_copy))
+        updated_cube = update(previous_cube, new_cube)
+        if replace_overlap and previous_cube is not None:
+            _add_previous_map(updated_cube, previous_cube, new_cube.dtype)
 
+        dst_copy = dst.with_name(f"{dst.stem}_copy{dst.suffix}")
+        iris.save(updated_cube, str(dst_copy))
         dst.unlink()
         dst_copy.rename(dst)
 
@@ -62,17 +120,267 @@ class Map(Task):
             self.log_error(f"Invalid netCDF extension in dst '{dst}'")
             raise ScriptEngineTaskArgumentInvalidError()
 
-    def compute_simulation_avg(self, merged_cube):
+    def check_statistics(self, statistics):
+        """check if statistics maps valid statistics to netCDF destinations"""
+        if not isinstance(statistics, dict):
+            self.log_error("Invalid 'statistics' argument, must be a dict")
+            raise ScriptEngineTaskArgumentInvalidError()
+        for statistic, dst in statistics.items():
+            if statistic not in _statistics:
+                self.log_error(
+                    f"Invalid statistic '{statistic}', "
+                    f"must be one of {', '.join(_statistics)}"
+                )
+                raise ScriptEngineTaskArgumentInvalidError()
+            self.check_file_extension(Path(dst))
+
+    def update_simulation_avg(self, current_cube, new_cube):
         """
-        Compute Time Average for the whole simulation.
+        Update the time average for the whole simulation with a new leg.
+
+        The average is computed in float64 and stored in the dtype of the legs,
+        together with the sum of time weights (the length of the time bounds)
+        as ancillary variable. Each leg is then a running-mean update of the
+        stored field, without merging and collapsing the cubes of all legs.
         """
-        self.log_debug("Computing simulation average.")
-        time_weights = helpers.cubes.compute_time_weights(
-            merged_cube, merged_cube.shape
+        self.log_debug("Updating simulation average.")
+        new_avg, new_weights = _time_weighted_avg(new_cube)
+        if current_cube is None:
+            simulation_avg, weights = new_avg, new_weights
+        else:
+            current_avg, current_weights = _time_weighted_avg(current_cube)
+            weights = current_weights + new_weights
+            weighted_sum = current_avg.filled(0.0) * current_weights
+            weighted_sum += new_avg.filled(0.0) * new_weights
+            simulation_avg = np.ma.masked_where(
+                weights == 0, _divide(weighted_sum, weights)
+            )
+
+        simulation_cube = _updated_cube(current_cube, new_cube, simulation_avg)
+        _add_time_weights(simulation_cube, weights)
+        return simulation_cube
+
+    def update_statistic(self, current_cube, new_cube, statistic):
+        """Update a statistic map with a new leg and set its metadata."""
+        if statistic == "std":
+            stat_cube = self.update_std(current_cube, new_cube)
+        else:
+            stat_cube = self.update_extremum(current_cube, new_cube, statistic)
+        return self.set_statistic_metadata(stat_cube, statistic)
+
+    def update_std(self, current_cube, new_cube):
+        """
+        Update the standard deviation of the leg maps with a new leg.
+
+        Uses the weighted form of Welford's algorithm. The running mean (in
+        float64) and the sum of time weights are kept as ancillary variables.
+        """
+        self.log_debug("Updating standard deviation.")
+        new_avg, new_weights = _time_weighted_avg(new_cube)
+        new_avg = new_avg.filled(0.0)
+        if current_cube is None:
+            mean, weights = new_avg, new_weights
+            sum_of_squares = np.zeros_like(new_avg)
+        else:
+            mean = _ancillary_data(current_cube, _time_mean_name)
+            current_weights = _time_weights(current_cube)
+            std = np.ma.asarray(current_cube.data, dtype=np.float64).filled(0.0)
+            sum_of_squares = std**2 * current_weights
+            weights = current_weights + new_weights
+            delta = new_avg - mean
+            mean = mean + _divide(new_weights, weights) * delta
+            sum_of_squares += new_weights * delta * (new_avg - mean)
+
+        std = np.ma.masked_where(
+            weights == 0, np.sqrt(_divide(sum_of_squares, weights))
         )
-        simulation_avg = merged_cube.collapsed(
-            "time",
-            iris.analysis.MEAN,
-            weights=time_weights,
+        std_cube = _updated_cube(current_cube, new_cube, std)
+        _add_time_weights(std_cube, weights)
+        std_cube.add_ancillary_variable(
+            iris.coords.AncillaryVariable(
+                mean,
+                var_name=_time_mean_name,
+                long_name="time-weighted mean over all legs",
+                units=new_cube.units,
+            ),
+            tuple(range(std_cube.ndim)),
         )
-        return simulation_avg
+        return std_cube
+
+    def update_extremum(self, current_cube, new_cube, statistic):
+        """Update the minimum or maximum of the leg maps with a new leg."""
+        self.log_debug(f"Updating {_statistics[statistic]}.")
+        new_data = np.ma.asarray(new_cube.data, dtype=np.float64)
+        if current_cube is None:
+            extremum = new_data
+        else:
+            current_data = np.ma.asarray(current_cube.data, dtype=np.float64)
+            # fmin/fmax ignore NaN, so a point is only masked if masked in both
+            function = np.fmin if statistic == "min" else np.fmax
+            extremum = np.ma.masked_invalid(
+                function(current_data.filled(np.nan), new_data.filled(np.nan))
+            )
+        return _updated_cube(current_cube, new_cube, extremum)
+
+    def set_statistic_metadata(self, cube, statistic):
+        """Set names, cell methods and metadata of a statistic map cube."""
+        method = _statistics[statistic]
+        label = method.replace("_", " ")
+        name, var_name = cube.name(), cube.var_name
+        cube.long_name = f"{name} {label}"
+        if var_name:
+            cube.var_name = f"{var_name}_{statistic}"
+        cube.cell_methods = tuple(
+            (
+                iris.coords.CellMethod(
+                    f"{method} over years",
+                    coords=cell_method.coord_names,
+                    intervals=cell_method.intervals,
+                    comments=cell_method.comments,
+                )
+                if cell_method.method == "mean over years"
+                else cell_method
+            )
+            for cell_method in cube.cell_methods
+        )
+        return helpers.cubes.set_metadata(
+            cube,
+            title=f"{name} ({label} over legs)",
+            comment=f"{label.capitalize()} over legs of **{var_name or name}**.",
+        )
+
+
+def _divide(numerator, denominator):
+    """Elementwise division, yielding zero where the denominator is zero."""
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros_like(numerator),
+        where=denominator != 0,
+    )
+
+
+def _updated_cube(current_cube, new_cube, data):
+    """
+    Copy of new_cube with data and time bounds covering all legs. The data is
+    computed in float64 but stored in the (floating point) dtype of new_cube.
+    """
+    updated_cube = new_cube.copy(
+        data=data.astype(np.promote_types(new_cube.dtype, np.float32))
+    )
+    if current_cube is not None:
+        time_coord = updated_cube.coord("time")
+        first_bound = current_cube.coord("time").bounds[0][0]
+        last_bound = time_coord.bounds[-1][-1]
+        time_coord.points = [(first_bound + last_bound) / 2]
+        time_coord.bounds = [[first_bound, last_bound]]
+    return updated_cube
+
+
+def _ancillary_data(cube, var_name):
+    """Return the data of an ancillary variable of a cube as float64 or None."""
+    for ancillary_variable in cube.ancillary_variables():
+        if ancillary_variable.var_name == var_name:
+            return np.asarray(ancillary_variable.data, dtype=np.float64)
+    return None
+
+
+def _add_time_weights(cube, weights):
+    """
+    Add the time weights per grid point as ancillary variable. Usually, all
+    unmasked points have the same weight, which is then stored as scalar.
+    """
+    dims = tuple(range(cube.ndim))
+    nonzero = weights[weights != 0]
+    if (
+        nonzero.size
+        and (nonzero == nonzero[0]).all()
+        and np.array_equal(weights == 0, np.ma.getmaskarray(cube.data))
+    ):
+        weights, dims = nonzero[0], None
+    cube.add_ancillary_variable(
+        iris.coords.AncillaryVariable(
+            weights,
+            var_name=_time_weights_name,
+            long_name="sum of time weights over all legs",
+            units=str(cube.coord("time").units).split(" since ")[0],
+        ),
+        dims,
+    )
+
+
+def _add_previous_map(cube, previous_cube, dtype):
+    """
+    Store the data and ancillary variables of previous_cube with cube, fields in
+    dtype (the dtype of the legs) to keep the file small.
+    """
+    dims = tuple(range(cube.ndim))
+    data = np.ma.asarray(previous_cube.data, dtype=dtype).filled(np.nan)
+    cube.add_ancillary_variable(
+        iris.coords.AncillaryVariable(
+            data,
+            var_name=_previous_map_name,
+            long_name="map before the last leg",
+            units=previous_cube.units,
+        ),
+        dims,
+    )
+    for ancillary_variable in previous_cube.ancillary_variables():
+        var_name = ancillary_variable.var_name or ""
+        if var_name == _previous_map_name or var_name.endswith(_previous_suffix):
+            continue
+        variable_dims = previous_cube.ancillary_variable_dims(ancillary_variable)
+        previous_variable = ancillary_variable.copy(
+            np.asarray(ancillary_variable.data, dtype=dtype)
+            if variable_dims == dims
+            else None
+        )
+        previous_variable.var_name = var_name + _previous_suffix
+        previous_variable.long_name = (
+            f"{ancillary_variable.long_name} before the last leg"
+        )
+        cube.add_ancillary_variable(previous_variable, variable_dims or None)
+
+
+def _previous_cube(cube):
+    """
+    Return the map before the last leg, as stored by _add_previous_map, or None
+    if it is not stored.
+    """
+    data = _ancillary_data(cube, _previous_map_name)
+    if data is None:
+        return None
+    previous_cube = cube.copy(data=np.ma.masked_invalid(data))
+    for ancillary_variable in previous_cube.ancillary_variables():
+        previous_cube.remove_ancillary_variable(ancillary_variable)
+    for ancillary_variable in cube.ancillary_variables():
+        var_name = ancillary_variable.var_name or ""
+        if var_name != _previous_map_name and var_name.endswith(_previous_suffix):
+            variable = ancillary_variable.copy()
+            variable.var_name = var_name[: -len(_previous_suffix)]
+            variable.long_name = ancillary_variable.long_name[
+                : -len(" before the last leg")
+            ]
+            previous_cube.add_ancillary_variable(
+                variable, cube.ancillary_variable_dims(ancillary_variable) or None
+            )
+    return previous_cube
+
+
+def _time_weighted_avg(cube):
+    """Return the data of a map cube as float64 and its time weights."""
+    return np.ma.asarray(cube.data, dtype=np.float64), _time_weights(cube)
+
+
+def _time_weights(cube):
+    """
+    Return the time weights per grid point of a map cube, zero where masked.
+
+    Maps saved by earlier versions carry no time weights; for these, and for new
+    legs, the length of the time bounds is used for all unmasked grid points.
+    """
+    weights = _ancillary_data(cube, _time_weights_name)
+    if weights is None:
+        bounds = cube.coord("time").bounds
+        weights = bounds[-1][-1] - bounds[0][0]
+    return np.where(np.ma.getmaskarray(cube.data), 0.0, weights)
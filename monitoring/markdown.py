@@ -7,8 +7,7 @@ from scriptengine.jinja import filters as j2filters
 from scriptengine.tasks.core import Task, timed_runner
 
 from helpers.exceptions import PresentationException
-from helpers.files import ChangeDirectory, get_template
-from helpers.presentation_objects import PresentationObject
+from helpers.files import get_template
 
 
 class Markdown(Task):
@@ -32,31 +31,28 @@ class Markdown(Task):
         self.log_info(f"Create Markdown report at {dst_folder}.")
         self.log_debug(f"Template: {template_path}, Source File(s): {sources}")
 
-        presentation_list = self.get_presentation_list(sources, dst_folder)
+        workers = self.getarg("workers", context, default=1)
+        presentation_list = self.get_presentation_list(sources, dst_folder, workers)
         md_template = get_template(context, template_path)
 
-        with ChangeDirectory(dst_folder):
-            with open("./summary.md", "w") as md_out:
-                md_out.write(
-                    md_template.render(
-                        presentation_list=presentation_list,
-                    )
+        with open(Path(dst_folder) / "summary.md", "w") as md_out:
+            md_out.write(
+                md_template.render(
+                    presentation_list=presentation_list,
                 )
+            )
 
-    def get_presentation_list(self, sources, dst_folder):
+    def get_presentation_list(self, sources, dst_folder, workers=1):
         """create a list of presentation objects"""
+        # plotting libraries are only imported when presenting
+        from helpers.presentation_objects import create_dicts
+
         self.log_debug("Getting list of presentation objects.")
         presentation_list = []
-        for src in sources:
-            try:
-                try:
-                    pres_object = PresentationObject(dst_folder, **src)
-                except TypeError:
-                    pres_object = PresentationObject(dst_folder, src)
-                self.log_debug(
-                    f"Loading {pres_object.loader.diag_type} diagnostic from {pres_object.loader.path}."
-                )
-                presentation_list.append(pres_object.create_dict())
-            except PresentationException as msg:
-                self.log_warning(f"Can not present diagnostic: {msg}")
+        for src, result in zip(sources, create_dicts(sources, dst_folder, workers)):
+            if isinstance(result, PresentationException):
+                self.log_warning(f"Can not present diagnostic: {result}")
+            else:
+                self.log_debug(f"Loaded {result['presentation_type']} from {src}.")
+                presentation_list.append(result)
         return presentation_list
@@ -27,19 +27,21 @@ class NemoAllMeanMap(Map):
         src = self.getarg("src", context)
         dst = Path(self.getarg("dst", context))
         varname = self.getarg("varname", context)
+        statistics = self.getarg("statistics", context, default={})
         self.log_info(f"Create map for ocean variable {varname} at {dst}.")
         self.log_debug(f"Source file(s): {src}")
 
         self.check_file_extension(dst)
+        self.check_statistics(statistics)
 
         leg_cube = helpers.cubes.load_input_cube(src, varname)
 
         # Remove auxiliary time coordinate before collapsing cube
         leg_cube.remove_coord(leg_cube.coord("time", dim_coords=False))
 
-        time_weights = helpers.cubes.compute_time_weights(leg_cube, leg_cube.shape)
-        leg_average = leg_cube.collapsed(
-            "time", iris.analysis.MEAN, weights=time_weights
+        time_weights = helpers.cubes.compute_time_weights(leg_cube)
+        leg_average = helpers.cubes.weighted_aggregate(
+            leg_cube, "time", time_weights, iris.analysis.MEAN
         )
 
         leg_average.coord("time").climatological = True
@@ -52,7 +54,9 @@ class NemoAllMeanMap(Map):
             map_type="global ocean",
         )
 
-        self.save(leg_average, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(leg_average, dst, replace_overlap)
+        self.save_statistics(leg_average, statistics, replace_overlap)
 
     def set_cell_methods(self, cube):
         """Set the correct cell methods."""
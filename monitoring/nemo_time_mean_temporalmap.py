@@ -39,7 +39,8 @@ class NemoTimeMeanTemporalmap(Temporalmap):
         leg_cube.remove_coord(leg_cube.coord("time", dim_coords=False))
 
         processed_cube = self.time_operation(varname, leg_cube)
-        self.save(processed_cube, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(processed_cube, dst, replace_overlap)
 
     def time_operation(self, varname, leg_cube):
         raise NotImplementedError(
@@ -52,9 +53,9 @@ class NemoYearMeanTemporalmap(NemoTimeMeanTemporalmap):
 
     def time_operation(self, varname, leg_cube):
         self.log_debug("Creating an annual mean.")
-        month_weights = helpers.cubes.compute_time_weights(leg_cube, leg_cube.shape)
-        leg_average = leg_cube.collapsed(
-            "time", iris.analysis.MEAN, weights=month_weights
+        month_weights = helpers.cubes.compute_time_weights(leg_cube)
+        leg_average = helpers.cubes.weighted_aggregate(
+            leg_cube, "time", month_weights, iris.analysis.MEAN
         )
         # Promote time from scalar to dimension coordinate
         leg_average = iris.util.new_axis(leg_average, "time")
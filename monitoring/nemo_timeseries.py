@@ -27,12 +27,12 @@ class NemoTimeseries(Timeseries):
             {**arguments, "title": None, "coord_value": None, "data_value": None}
         )
 
-    def _load_input(self, context):
+    def _load_input(self, context, cache=True):
         src = self.getarg("src", context)
         var_name = self.getarg("varname", context)
         self.log_info(f"Create time series for ocean variable {var_name}.")
 
-        var_data = helpers.cubes.load_input_cube(src, var_name)
+        var_data = helpers.cubes.load_input_cube(src, var_name, cache)
         return var_data
 
 
@@ -45,40 +45,18 @@ class NemoGlobalSumYearMeanTimeseries(NemoTimeseries):
 
     @timed_runner
     def run(self, context):
-        var_data = self._load_input(context)
+        levels_per_block = self.getarg("levels_per_block", context, default=None)
+        # the cache would realise the data that is meant to be read in blocks
+        var_data = self._load_input(context, cache=levels_per_block is None)
 
         domain = self.getarg("domain", context)
         grid = self.getarg("grid", context, default="T")
-        global_sum = helpers.nemo.compute_global_aggregate(
-            var_data, domain, grid, iris.analysis.SUM
-        )
-
-        annual_mean = helpers.cubes.compute_annual_mean(global_sum)
-
-        annual_mean.cell_methods = (
-            iris.coords.CellMethod("mean", coords="time", intervals="1 year"),
-            iris.coords.CellMethod(
-                "sum",
-                coords=(
-                    ("area", helpers.nemo.depth_coord(annual_mean).name())
-                    if helpers.nemo.has_depth(annual_mean)
-                    else "area"
-                ),
-            ),
-        )
-
-        long_name = annual_mean.long_name
-        var_name = annual_mean.standard_name
-        comment = f"Product of {long_name} / **{var_name}** and grid-cell area, summed over all grid cells."
-        annual_mean = helpers.cubes.set_metadata(
-            annual_mean,
-            title=f"{long_name} (annual mean)",
-            comment=comment,
-        )
+        annual_mean = global_sum_year_mean(var_data, domain, grid, levels_per_block)
 
         dst = Path(self.getarg("dst", context))
         self.check_file_extension(dst)
-        self.save(annual_mean, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(annual_mean, dst, replace_overlap)
 
 
 class NemoGlobalMeanYearMeanTimeseries(NemoTimeseries):
@@ -90,41 +68,18 @@ class NemoGlobalMeanYearMeanTimeseries(NemoTimeseries):
 
     @timed_runner
     def run(self, context):
-        var_data = self._load_input(context)
+        levels_per_block = self.getarg("levels_per_block", context, default=None)
+        # the cache would realise the data that is meant to be read in blocks
+        var_data = self._load_input(context, cache=levels_per_block is None)
 
         domain = self.getarg("domain", context)
         grid = self.getarg("grid", context, default="T")
-        global_mean = helpers.nemo.compute_global_aggregate(
-            var_data, domain, grid, iris.analysis.MEAN
-        )
-
-        annual_mean = helpers.cubes.compute_annual_mean(global_mean)
-
-        annual_mean.cell_methods = (
-            iris.coords.CellMethod("mean", coords="time", intervals="1 year"),
-            iris.coords.CellMethod(
-                "mean",
-                coords=(
-                    ("area", helpers.nemo.depth_coord(annual_mean).name())
-                    if helpers.nemo.has_depth(annual_mean)
-                    else "area"
-                ),
-            ),
-        )
-
-        long_name = annual_mean.long_name
-        var_name = annual_mean.standard_name
-        comment = f"Global mean of {long_name} / **{var_name}**."
-
-        annual_mean = helpers.cubes.set_metadata(
-            annual_mean,
-            title=f"{long_name} (annual mean)",
-            comment=comment,
-        )
+        annual_mean = global_mean_year_mean(var_data, domain, grid, levels_per_block)
 
         dst = Path(self.getarg("dst", context))
         self.check_file_extension(dst)
-        self.save(annual_mean, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(annual_mean, dst, replace_overlap)
 
 
 class NemoYearMeanTimeseries(NemoTimeseries):
@@ -136,22 +91,175 @@ class NemoYearMeanTimeseries(NemoTimeseries):
             self.log_error(f"Input data is not one-dimensional.")
             raise ScriptEngineTaskArgumentInvalidError
 
-        annual_mean = helpers.cubes.compute_annual_mean(var_data)
+        annual_mean = year_mean(var_data)
 
-        annual_mean.cell_methods = (
-            iris.coords.CellMethod("mean", coords="time", intervals="1 year"),
+        dst = Path(self.getarg("dst", context))
+        self.check_file_extension(dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(annual_mean, dst, replace_overlap)
+
+
+class NemoMultiTimeseries(Timeseries):
+    """
+    NemoMultiTimeseries Processing Task
+
+    Computes several time series from one set of NEMO output files, reading the
+    input files only once.
+    """
+
+    _required_arguments = (
+        "src",
+        "diagnostics",
+    )
+
+    def __init__(self, arguments):
+        NemoMultiTimeseries.check_arguments(arguments)
+        super().__init__(
+            {
+                **arguments,
+                "title": None,
+                "coord_value": None,
+                "data_value": None,
+                "dst": None,
+            }
         )
 
-        long_name = annual_mean.long_name
-        var_name = annual_mean.standard_name
-        comment = f"Annual mean of {long_name} / **{var_name}**."
+    @timed_runner
+    def run(self, context):
+        src = self.getarg("src", context)
+        diagnostics = self.getarg("diagnostics", context)
+        self.log_info("Create time series for multiple ocean variables.")
+        self.check_diagnostics(diagnostics)
 
-        annual_mean = helpers.cubes.set_metadata(
-            annual_mean,
-            title=f"{long_name} (annual mean)",
-            comment=comment,
+        grid = self.getarg("grid", context, default="T")
+        levels_per_block = self.getarg("levels_per_block", context, default=None)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        domain = None
+        if any(d["operation"] in _global_operations for d in diagnostics):
+            domain = self.getarg("domain", context)
+
+        varnames = list(dict.fromkeys(d["varname"] for d in diagnostics))
+        var_data = helpers.cubes.load_input_cubes(
+            src, varnames, cache=levels_per_block is None
         )
+        for diagnostic in diagnostics:
+            varname, operation = diagnostic["varname"], diagnostic["operation"]
+            self.log_debug(f"Computing {operation} of {varname}.")
+            # shallow copy, sharing the data between diagnostics of one variable
+            cube = var_data[varname]
+            cube = cube.copy(data=cube.core_data())
+            if operation == "year_mean":
+                if not cube.ndim == 1:
+                    self.log_error(f"Input data for {varname} is not one-dimensional.")
+                    raise ScriptEngineTaskArgumentInvalidError
+                annual_mean = year_mean(cube)
+            else:
+                annual_mean = _global_operations[operation](
+                    cube, domain, grid, levels_per_block
+                )
+            self.save(annual_mean, Path(diagnostic["dst"]), replace_overlap)
+
+    def check_diagnostics(self, diagnostics):
+        """check if diagnostics is a list of varname/operation/dst mappings"""
+        operations = ("year_mean", *_global_operations)
+        if not isinstance(diagnostics, list) or not all(
+            isinstance(d, dict) for d in diagnostics
+        ):
+            self.log_error("Invalid 'diagnostics' argument, must be a list of dicts")
+            raise ScriptEngineTaskArgumentInvalidError()
+        for diagnostic in diagnostics:
+            missing = [
+                k for k in ("varname", "operation", "dst") if k not in diagnostic
+            ]
+            if missing:
+                self.log_error(
+                    f"Missing {', '.join(missing)} in diagnostic {diagnostic}"
+                )
+                raise ScriptEngineTaskArgumentInvalidError()
+            if diagnostic["operation"] not in operations:
+                self.log_error(
+                    f"Invalid operation '{diagnostic['operation']}', "
+                    f"must be one of {', '.join(operations)}"
+                )
+                raise ScriptEngineTaskArgumentInvalidError()
+            self.check_file_extension(Path(diagnostic["dst"]))
+
+
+def _area_coords(cube):
+    return (
+        ("area", helpers.nemo.depth_coord(cube).name())
+        if helpers.nemo.has_depth(cube)
+        else "area"
+    )
 
-        dst = Path(self.getarg("dst", context))
-        self.check_file_extension(dst)
-        self.save(annual_mean, dst)
+
+def global_sum_year_mean(var_data, domain, grid, levels_per_block=None):
+    """Annual mean of the global sum, weighted with the NEMO cell size."""
+    global_sum = helpers.nemo.compute_global_aggregate(
+        var_data, domain, grid, iris.analysis.SUM, levels_per_block
+    )
+
+    annual_mean = helpers.cubes.compute_annual_mean(global_sum)
+
+    annual_mean.cell_methods = (
+        iris.coords.CellMethod("mean", coords="time", intervals="1 year"),
+        iris.coords.CellMethod("sum", coords=_area_coords(annual_mean)),
+    )
+
+    long_name = annual_mean.long_name
+    var_name = annual_mean.standard_name
+    comment = f"Product of {long_name} / **{var_name}** and grid-cell area, summed over all grid cells."
+    return helpers.cubes.set_metadata(
+        annual_mean,
+        title=f"{long_name} (annual mean)",
+        comment=comment,
+    )
+
+
+def global_mean_year_mean(var_data, domain, grid, levels_per_block=None):
+    """Annual mean of the global mean, weighted with the NEMO cell size."""
+    global_mean = helpers.nemo.compute_global_aggregate(
+        var_data, domain, grid, iris.analysis.MEAN, levels_per_block
+    )
+
+    annual_mean = helpers.cubes.compute_annual_mean(global_mean)
+
+    annual_mean.cell_methods = (
+        iris.coords.CellMethod("mean", coords="time", intervals="1 year"),
+        iris.coords.CellMethod("mean", coords=_area_coords(annual_mean)),
+    )
+
+    long_name = annual_mean.long_name
+    var_name = annual_mean.standard_name
+    comment = f"Global mean of {long_name} / **{var_name}**."
+
+    return helpers.cubes.set_metadata(
+        annual_mean,
+        title=f"{long_name} (annual mean)",
+        comment=comment,
+    )
+
+
+def year_mean(var_data):
+    """Annual mean of one-dimensional data."""
+    annual_mean = helpers.cubes.compute_annual_mean(var_data)
+
+    annual_mean.cell_methods = (
+        iris.coords.CellMethod("mean", coords="time", intervals="1 year"),
+    )
+
+    long_name = annual_mean.long_name
+    var_name = annual_mean.standard_name
+    comment = f"Annual mean of {long_name} / **{var_name}**."
+
+    return helpers.cubes.set_metadata(
+        annual_mean,
+        title=f"{long_name} (annual mean)",
+        comment=comment,
+    )
+
+
+_global_operations = {
+    "global_mean": global_mean_year_mean,
+    "global_sum": global_sum_year_mean,
+}
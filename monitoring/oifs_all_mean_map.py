@@ -28,10 +28,12 @@ class OifsAllMeanMap(Map):
         src = self.getarg("src", context)
         dst = Path(self.getarg("dst", context))
         varname = self.getarg("varname", context)
+        statistics = self.getarg("statistics", context, default={})
         self.log_info(f"Create map for atmosphere variable {varname} at '{dst}'.")
         self.log_debug(f"Source file: {src}")
 
         self.check_file_extension(dst)
+        self.check_statistics(statistics)
 
         oifs_cube = helpers.cubes.load_input_cube(src, varname)
 
@@ -39,7 +41,9 @@ class OifsAllMeanMap(Map):
 
         self.set_cell_methods(map_cube)
         map_cube = self.adjust_metadata(map_cube, varname)
-        self.save(map_cube, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(map_cube, dst, replace_overlap)
+        self.save_statistics(map_cube, statistics, replace_overlap)
 
     def compute_time_mean(self, output_cube):
         """Apply the temporal average."""
@@ -5,7 +5,6 @@ from pathlib import Path
 
 import iris
 from iris.analysis import WeightedAggregator
-from iris.coords import CellMeasure
 from scriptengine.tasks.core import timed_runner
 
 import helpers.cubes
@@ -55,11 +54,6 @@ class OifsTimeseries(Timeseries):
     def _compute_global_aggregate(self, cube, operation: WeightedAggregator):
         """Area-weighted aggregate of cube (e.g., sum, mean)."""
         area_weights = helpers.cubes.compute_area_weights(cube)
-        cell_size = CellMeasure(
-            area_weights, var_name="cell_size", units="m2", measure="area"
-        )
-        dims = tuple(range(len(area_weights.shape)))
-        cube.add_cell_measure(cell_size, dims)
         # Remove duplicate boundary values before averaging
         cube.coord("latitude").bounds = cube.coord("latitude").bounds[:, [0, 1]]
         cube.coord("longitude").bounds = cube.coord("longitude").bounds[:, [0, 1]]
@@ -70,10 +64,12 @@ class OifsTimeseries(Timeseries):
                 "Collapsing a non-contiguous coordinate.",
                 UserWarning,
             )
-            global_aggregate = cube.collapsed(
+            global_aggregate = helpers.cubes.weighted_aggregate(
+                cube,
                 ["latitude", "longitude"],
+                area_weights,
                 operation,
-                weights="cell_size",
+                weights_units="m2",
             )
         return global_aggregate
 
@@ -101,7 +97,8 @@ class OifsGlobalMeanYearMeanTimeseries(OifsTimeseries):
 
         dst = Path(self.getarg("dst", context))
         self.check_file_extension(dst)
-        self.save(annual_mean, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(annual_mean, dst, replace_overlap)
 
 
 class OifsGlobalSumYearMeanTimeseries(OifsTimeseries):
@@ -127,4 +124,5 @@ class OifsGlobalSumYearMeanTimeseries(OifsTimeseries):
 
         dst = Path(self.getarg("dst", context))
         self.check_file_extension(dst)
-        self.save(annual_mean, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(annual_mean, dst, replace_overlap)
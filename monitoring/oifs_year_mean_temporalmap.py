@@ -35,7 +35,8 @@ class OifsYearMeanTemporalmap(Temporalmap):
 
         temporalmap_cube = self.set_cell_methods(temporalmap_cube)
         temporalmap_cube = self.adjust_metadata(temporalmap_cube, varname)
-        self.save(temporalmap_cube, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(temporalmap_cube, dst, replace_overlap)
 
     def set_cell_methods(self, cube):
         """Set the correct cell methods."""
@@ -14,7 +14,6 @@ from scriptengine.tasks.core import Task, timed_runner
 
 from helpers.exceptions import PresentationException
 from helpers.files import get_template
-from helpers.presentation_objects import PresentationObject
 
 
 class Redmine(Task):
@@ -42,7 +41,8 @@ class Redmine(Task):
         self.log_info(f"Create Redmine issue '{issue_subject}'.")
         self.log_debug(f"Template: {template_path}, Source File(s): {sources}")
 
-        presentation_list = self.get_presentation_list(sources, dst_folder)
+        workers = self.getarg("workers", context, default=1)
+        presentation_list = self.get_presentation_list(sources, dst_folder, workers)
         redmine_template = get_template(context, template_path)
         redmine_template.globals["urlencode"] = urllib.parse.quote
 
@@ -78,22 +78,19 @@ class Redmine(Task):
         self.log_debug("Saving issue.")
         issue.save()
 
-    def get_presentation_list(self, sources, dst_folder):
+    def get_presentation_list(self, sources, dst_folder, workers=1):
         """create a list of presentation objects"""
+        # plotting libraries are only imported when presenting
+        from helpers.presentation_objects import create_dicts
+
         self.log_debug("Getting list of presentation objects.")
         presentation_list = []
-        for src in sources:
-            try:
-                try:
-                    pres_object = PresentationObject(dst_folder, **src)
-                except TypeError:
-                    pres_object = PresentationObject(dst_folder, src)
-                self.log_debug(
-                    f"Loading {pres_object.loader.diag_type} diagnostic from {pres_object.loader.path}."
-                )
-                presentation_list.append(pres_object.create_dict())
-            except PresentationException as msg:
-                self.log_warning(f"Can not present diagnostic: {msg}")
+        for src, result in zip(sources, create_dicts(sources, dst_folder, workers)):
+            if isinstance(result, PresentationException):
+                self.log_warning(f"Can not present diagnostic: {result}")
+            else:
+                self.log_debug(f"Loaded {result['presentation_type']} from {src}.")
+                presentation_list.append(result)
         return presentation_list
 
     def get_issue(self, redmine, issue_subject):
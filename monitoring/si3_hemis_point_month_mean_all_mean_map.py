@@ -74,6 +74,7 @@ class Si3HemisPointMonthMeanAllMeanMap(Map):
         dst = Path(self.getarg("dst", context))
         hemisphere = self.getarg("hemisphere", context)
         varname = self.getarg("varname", context)
+        statistics = self.getarg("statistics", context, default={})
 
         self.log_info(f"Map for {varname} ({hemisphere}ern hemisphere): {dst}")
         self.log_debug(f"Source file(s): {src}")
@@ -95,6 +96,7 @@ class Si3HemisPointMonthMeanAllMeanMap(Map):
             )
             return
         self.check_file_extension(dst)
+        self.check_statistics(statistics)
 
         month_cube = helpers.cubes.load_input_cube(src, varname)
         month_cube = helpers.cubes.remove_aux_time(month_cube)
@@ -121,4 +123,6 @@ class Si3HemisPointMonthMeanAllMeanMap(Map):
 
         month_cube = _set_cell_methods(month_cube, hemisphere)
 
-        self.save(month_cube, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(month_cube, dst, replace_overlap)
+        self.save_statistics(month_cube, statistics, replace_overlap)
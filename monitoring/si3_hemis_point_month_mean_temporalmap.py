@@ -112,4 +112,5 @@ class Si3HemisPointMonthMeanTemporalmap(Temporalmap):
 
         this_leg = _set_cell_methods(this_leg, hemisphere)
 
-        self.save(this_leg, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(this_leg, dst, replace_overlap)
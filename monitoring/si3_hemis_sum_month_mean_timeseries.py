@@ -119,4 +119,5 @@ class Si3HemisSumMonthMeanTimeseries(Timeseries):
         }
         this_leg_summed = helpers.cubes.set_metadata(this_leg_summed, **metadata)
         this_leg_summed = _set_cell_methods(this_leg_summed, hemisphere)
-        self.save(this_leg_summed, dst)
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(this_leg_summed, dst, replace_overlap)
@@ -1,10 +1,13 @@
 """Base class for temporal map processing tasks."""
 
+import functools
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
 import iris
+import iris.coords
 import iris.cube
+import numpy as np
 from scriptengine.exceptions import (
     ScriptEngineTaskArgumentInvalidError,
     ScriptEngineTaskRunError,
@@ -12,31 +15,84 @@ from scriptengine.exceptions import (
 from scriptengine.tasks.core import Task
 
 import helpers.cubes
+import helpers.files
+import helpers.netcdf
 
 
 class Temporalmap(Task):
     """Temporalmap Processing Task"""
 
-    def save(self, new_cube: iris.cube.Cube, dst: Path):
-        """save temporal map cube in netCDF file"""
+    def save(self, new_cube: iris.cube.Cube, dst: Path, replace_overlap=False):
+        """
+        save temporal map cube in netCDF file
+
+        New maps are inserted in time order, so that legs can be processed out
+        of order. With replace_overlap, maps that cover the same time as the
+        last stored ones, e.g. of a leg that is run again, replace these in
+        place.
+        """
         self.log_debug(f"Saving temporal map cube to {dst}")
         new_cube.attributes["diagnostic_type"] = "temporal map"
-        try:
-            current_cube = iris.load_cube(str(dst))
-        except OSError:  # file does not exist yet.
-            iris.save(new_cube, dst)
+        # Other tasks may update the same file, e.g. when legs run concurrently
+        with helpers.files.FileLock(dst):
+            self._save_locked(new_cube, dst, replace_overlap)
+
+    def _save_locked(self, new_cube, dst, replace_overlap):
+        # Unlimited time dimension with one chunk per leg: appending a leg
+        # only writes the new slab, not the whole history
+        save_kwargs = {"unlimited_dimensions": ["time"], "chunksizes": new_cube.shape}
+        if not dst.exists():
+            _add_revisions(new_cube, np.zeros(new_cube.shape[0], dtype=np.int32))
+            iris.save(new_cube, str(dst), **save_kwargs)
             return
+        dimension = helpers.netcdf.unlimited_dimension(dst)
+
+        if dimension is None:
+            self.log_debug("No unlimited time dimension, rewriting the whole file.")
+            self.save_concatenated(new_cube, dst, **save_kwargs)
+            return
+
+        num_records = len(new_cube.coord("time").points)
+        last_time = helpers.netcdf.last_record_coord(dst, dimension, num_records)
+        new_cube = helpers.cubes.align_time_coord(new_cube, last_time)
+        new_time = new_cube.coord("time")
+        revisions = np.zeros(num_records, dtype=np.int32)
+        if replace_overlap and helpers.cubes.same_records(last_time, new_time):
+            self.log_warning(f"Replacing the last {num_records} map(s)")
+            # count the replacement, so that the maps are presented again
+            stored_revisions = helpers.netcdf.record_revisions(dst, dimension)
+            if stored_revisions is not None:
+                revisions = stored_revisions[-num_records:] + 1
+            write_records = helpers.netcdf.replace_records
+        elif last_time.bounds[-1][-1] <= new_time.bounds[0][0]:
+            write_records = helpers.netcdf.append_records
+        else:
+            # an earlier leg, placed by the time coordinate of the stored maps
+            index = self.record_index(
+                helpers.netcdf.record_coord(dst, dimension), new_time
+            )
+            self.log_debug(f"Inserting before map {index}")
+            write_records = functools.partial(
+                helpers.netcdf.insert_records, index=index
+            )
+
+        _add_revisions(new_cube, revisions)
+        with NamedTemporaryFile() as tf:
+            iris.save(new_cube, tf.name, saver="nc", **save_kwargs)
+            try:
+                write_records(tf.name, dst, dimension)
+            except ValueError as e:
+                self.log_error(f"Cannot add temporal map to '{dst}': {e}")
+                raise ScriptEngineTaskRunError()
+
+    def save_concatenated(self, new_cube: iris.cube.Cube, dst: Path, **save_kwargs):
+        """load, concatenate and rewrite the whole temporal map file"""
+        current_cube = iris.load_cube(str(dst))
 
         # set units and attribute for time coord to be the same
         # in current_cube and new_cube
         new_cube = helpers.cubes.align_time_coords(new_cube, current_cube)
-
-        current_bounds = current_cube.coord("time").bounds
-        new_bounds = new_cube.coord("time").bounds
-        if current_bounds[-1][-1] > new_bounds[0][0]:
-            msg = "Non-monotonic coordinate. Cube will not be saved."
-            self.log_error(msg)
-            raise ScriptEngineTaskRunError()
+        self.check_monotonic_bounds(current_cube.coord("time"), new_cube.coord("time"))
 
         # Iris changes metadata when saving/loading cube
         # save & reload to prevent metadata mismatch
@@ -48,15 +104,44 @@ class Temporalmap(Task):
 
             cube_list = iris.cube.CubeList([current_cube, new_cube])
             merged_cube = cube_list.concatenate_cube()
+            _add_revisions(merged_cube, np.zeros(merged_cube.shape[0], dtype=np.int32))
 
             dst_copy = dst.with_name(f"{dst.stem}_copy{dst.suffix}")
-            iris.save(merged_cube, str(dst_copy))
+            iris.save(merged_cube, str(dst_copy), **save_kwargs)
 
         dst.unlink()
         dst_copy.rename(dst)
 
+    def record_index(self, current_time, new_time):
+        """Return the index at which the new maps belong in the stored ones."""
+        try:
+            return helpers.cubes.record_index(current_time, new_time)
+        except ValueError as e:
+            self.log_error(f"{e}. Cube will not be saved.")
+            raise ScriptEngineTaskRunError()
+
+    def check_monotonic_bounds(self, current_time, new_time):
+        """check that the new time bounds follow the current ones"""
+        if current_time.bounds[-1][-1] > new_time.bounds[0][0]:
+            msg = "Non-monotonic coordinate. Cube will not be saved."
+            self.log_error(msg)
+            raise ScriptEngineTaskRunError()
+
     def check_file_extension(self, dst: Path):
         """check if destination file has a valid netCDF extension"""
         if dst.suffix != ".nc":
             self.log_error(f"Invalid netCDF extension in dst '{dst}'")
             raise ScriptEngineTaskArgumentInvalidError()
+
+
+def _add_revisions(cube, revisions):
+    """Add the revision of each map along time as ancillary variable."""
+    cube.add_ancillary_variable(
+        iris.coords.AncillaryVariable(
+            revisions,
+            var_name=helpers.netcdf.record_revision_name,
+            long_name="number of times the map was replaced",
+            units="1",
+        ),
+        cube.coord_dims("time"),
+    )
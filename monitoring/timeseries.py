@@ -15,6 +15,8 @@ from scriptengine.exceptions import (
 from scriptengine.tasks.core import Task, timed_runner
 
 import helpers.cubes
+import helpers.files
+import helpers.netcdf
 
 
 class Timeseries(Task):
@@ -80,18 +82,35 @@ class Timeseries(Task):
             title=title,
             comment=comment,
         )
-        self.save(data_cube, dst)
-
-    def save(self, new_cube: iris.cube.Cube, dst: Path):
-        """save time series cube in netCDF file"""
+        replace_overlap = self.getarg("replace_overlap", context, default=False)
+        self.save(data_cube, dst, replace_overlap)
+
+    def save(self, new_cube: iris.cube.Cube, dst: Path, replace_overlap=False):
+        """
+        save time series cube in netCDF file
+
+        New records are inserted in time order, so that legs can be processed
+        out of order. With replace_overlap, records that cover the same time as
+        the last stored ones, e.g. of a leg that is run again, replace these in
+        place.
+        """
         self.log_debug(f"Saving time series cube to {dst}")
 
         new_cube.attributes["diagnostic_type"] = "time series"
-        try:
-            current_cube = iris.load_cube(str(dst))
-        except OSError:  # file does not exist yet.
-            iris.save(new_cube, str(dst))
+        # Other tasks may update the same file, e.g. when legs run concurrently
+        with helpers.files.FileLock(dst):
+            self._save_locked(new_cube, dst, replace_overlap)
+
+    def _save_locked(self, new_cube, dst, replace_overlap):
+        # Save with an unlimited record dimension, so that later legs can be
+        # appended in place instead of rewriting the whole file
+        record_dim = new_cube.coord(dimensions=0, dim_coords=True).name()
+        if replace_overlap and self.replace_last_records(new_cube, dst, record_dim):
             return
+        if not dst.exists():
+            iris.save(new_cube, str(dst), unlimited_dimensions=[record_dim])
+            return
+        current_cube = iris.load_cube(str(dst))
 
         # set units and attribute for time coord to be the same
         # in current_cube and new_cube
@@ -103,35 +122,78 @@ class Timeseries(Task):
             # Cube does not use "time" as its DimCoord
             pass
 
-        self.test_monotonic_increase(current_cube.coords()[0], new_cube.coords()[0])
+        index = self.record_index(current_cube.coords()[0], new_cube.coords()[0])
 
         # Iris changes metadata when saving/loading cube
         # save & reload to prevent metadata mismatch
         # keep tempfile until the merged cube is saved
         with tempfile.NamedTemporaryFile() as tf:
-            iris.save(new_cube, tf.name, saver="nc")
+            iris.save(new_cube, tf.name, saver="nc", unlimited_dimensions=[record_dim])
             new_cube = iris.load_cube(tf.name)
 
-            cube_list = iris.cube.CubeList([current_cube, new_cube])
+            # Concatenating the (lazy) cubes checks that they are compatible
+            num_records = current_cube.shape[0]
+            cube_list = iris.cube.CubeList([current_cube[:index]] if index > 0 else [])
+            cube_list.append(new_cube)
+            if index < num_records:
+                cube_list.append(current_cube[index:])
             merged_cube = cube_list.concatenate_cube()
 
+            dimension = helpers.netcdf.unlimited_dimension(tf.name)
+            if helpers.netcdf.unlimited_dimension(dst) == dimension:
+                if index == num_records:
+                    self.log_debug(f"Appending to unlimited dimension '{dimension}'")
+                    helpers.netcdf.append_records(tf.name, dst, dimension)
+                else:
+                    self.log_debug(f"Inserting before record {index} of '{dimension}'")
+                    helpers.netcdf.insert_records(tf.name, dst, dimension, index)
+                return
+
+            # Files written without an unlimited dimension are rewritten once
             dst_copy = dst.with_name(f"{dst.stem}_copy{dst.suffix}")
-            iris.save(merged_cube, str(dst_copy))
+            iris.save(merged_cube, str(dst_copy), unlimited_dimensions=[record_dim])
 
         dst.unlink()
         dst_copy.rename(dst)
 
-    def test_monotonic_increase(self, old_coord, new_coord):
-        """Test if coordinate is monotonically increasing."""
-        current_bounds = old_coord.bounds
-        new_bounds = new_coord.bounds
-        msg = "Non-monotonic time coordinate. Cube will not be saved."
-        if current_bounds is not None and new_bounds is not None:
-            if current_bounds[-1][-1] > new_bounds[0][0]:
-                self.log_error(msg)
-                raise ScriptEngineTaskRunError()
-        if old_coord.points[-1] > new_coord.points[0]:
-            self.log_error(msg)
+    def replace_last_records(self, new_cube, dst, record_dim):
+        """
+        Overwrite the last records in dst with new_cube if they cover the same
+        time. Only the coordinate of the last records is read from dst.
+        Returns False if the records differ or dst can not be updated in place.
+        """
+        if not dst.exists():
+            return False
+        # The netCDF dimension is named by the var_name of the coordinate,
+        # e.g. "Leg_Number" for "Leg Number", so compare the coordinates
+        dimension = helpers.netcdf.unlimited_dimension(dst)
+        if dimension is None:
+            return False
+        new_coord = new_cube.coord(dimensions=0, dim_coords=True)
+        last_coord = helpers.netcdf.last_record_coord(
+            dst, dimension, len(new_coord.points)
+        )
+        if last_coord.name() != new_coord.name():
+            return False
+        if new_coord.name() == "time":
+            new_coord = helpers.cubes.align_time_coord(new_cube, last_coord).coord(
+                "time"
+            )
+        if not helpers.cubes.same_records(last_coord, new_coord):
+            return False
+
+        self.log_warning(f"Replacing the last {len(new_coord.points)} record(s)")
+        with tempfile.NamedTemporaryFile() as tf:
+            iris.save(new_cube, tf.name, saver="nc", unlimited_dimensions=[record_dim])
+            helpers.netcdf.replace_records(tf.name, dst, dimension)
+        return True
+
+    def record_index(self, old_coord, new_coord):
+        """Return the index at which the new records belong in the stored ones."""
+        try:
+            return helpers.cubes.record_index(old_coord, new_coord)
+        except ValueError as e:
+            self.log_error(f"{e}. Cube will not be saved.")
             raise ScriptEngineTaskRunError()
 
     def check_file_extension(self, dst):
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Keep the on-disk caches of each test out of the user's cache directory"""
+    monkeypatch.setenv(
+        "ECE_MONITORING_CACHE_DIR", str(tmp_path_factory.mktemp("cache"))
+    )
@@ -1,12 +1,19 @@
 """Tests for Iris cubes helpers"""
 
+import os
+from unittest import mock
+
 import cf_units
+import dask.array as da
+import iris
+import iris.analysis
 import numpy as np
 import pytest
 from iris.coords import AuxCoord, DimCoord
 from iris.cube import Cube
 from iris.exceptions import CoordinateNotFoundError
 
+import helpers.cache
 import helpers.cubes
 
 
@@ -134,3 +141,233 @@ def test_annual_time_bounds():
 def test_unit_conversions(unit, converted_unit):
     cube = Cube(np.array([1]), units=unit)
     assert helpers.cubes.convert_units(cube).units == cf_units.Unit(converted_unit)
+
+
+def _save_input_cube(path, data, varname="tos"):
+    cube = Cube(
+        np.ma.masked_less(np.array(data, dtype=np.float32), 0),
+        var_name=varname,
+        units="kelvin",
+        dim_coords_and_dims=[
+            (DimCoord([0.0, 1.0], var_name="x", long_name="x"), 0),
+        ],
+    )
+    iris.save(cube, str(path))
+
+
+def test_load_input_cube_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers.cache, "input_cubes", helpers.cache.CubeCache())
+    src = tmp_path / "input.nc"
+    _save_input_cube(src, [273.15, -1])
+
+    first = helpers.cubes.load_input_cube(str(src), "tos")
+    with mock.patch("iris.load") as load:
+        second = helpers.cubes.load_input_cube([src], "tos")
+    load.assert_not_called()
+    assert len(helpers.cache.input_cubes) == 1
+
+    # copy-on-write: changing one cube leaves the cache and other cubes alone
+    helpers.cubes.convert_units(first)
+    first.attributes["title"] = "Title"
+    with pytest.raises(ValueError):
+        second.data[0] = 0
+    third = helpers.cubes.load_input_cube(str(src), "tos")
+    assert first.units == "degC" and third.units == "kelvin"
+    assert "title" not in third.attributes
+    assert third.data[0] == pytest.approx(273.15)
+    assert third.data.mask.tolist() == [False, True]
+
+    # a rewritten file is not served from cache
+    _save_input_cube(src, [300.0, 301.0])
+    os.utime(src, ns=(0, 0))
+    assert helpers.cubes.load_input_cube(str(src), "tos").data[0] == 300.0
+
+
+def test_cube_cache_eviction():
+    cube = Cube(np.zeros(10, dtype=np.float64))
+    cache = helpers.cache.CubeCache(max_bytes=25 * 8)
+    for key in "abc":
+        cache.put(key, cube.copy())
+    assert len(cache) == 2 and cache.get("a") is None
+    cache.get("b")
+    cache.put("d", cube.copy())
+    assert cache.get("c") is None and cache.get("b") is not None
+    assert cache.nbytes == 20 * 8
+    cache.put("e", Cube(np.zeros(30)))
+    assert cache.get("e") is None and len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_render_cache_eviction(tmp_path):
+    png = tmp_path / "plot.png"
+    for n, key in enumerate(("a", "b", "c")):
+        png.write_bytes(b"x" * 100)
+        helpers.cache.save_render(key, png, max_bytes=1000)
+        # distinct access times, "a" used last
+        os.utime(helpers.cache._render_dir() / f"{key}.png", (n, n))
+    assert helpers.cache.load_render("a", tmp_path / "copy.png")
+    helpers.cache.save_render("d", png, max_bytes=250)
+    assert sorted(p.stem for p in helpers.cache._render_dir().glob("*.png")) == [
+        "a",
+        "d",
+    ]
+    assert not helpers.cache.load_render("b", tmp_path / "copy.png")
+
+
+def test_array_cache_eviction():
+    array = np.zeros(10, dtype=np.float64)
+    for n, name in enumerate(("a.npy", "b.npy", "c.npy")):
+        helpers.cache.save_array(name, array, max_bytes=1000**2)
+        # distinct access times, "a" used last
+        os.utime(helpers.cache.cache_dir() / name, (n, n))
+    assert helpers.cache.load_array("a.npy") is not None
+    size = (helpers.cache.cache_dir() / "a.npy").stat().st_size
+    helpers.cache.save_array("d.npy", array, max_bytes=2 * size)
+    assert sorted(p.name for p in helpers.cache.cache_dir().glob("*.npy")) == [
+        "a.npy",
+        "d.npy",
+    ]
+    assert helpers.cache.load_array("b.npy") is None
+
+
+def test_reduced_grid_areas():
+    # Octahedral-like reduced gaussian grid, from north to south
+    sin_lats, _ = np.polynomial.legendre.leggauss(16)
+    ring_lats = np.rad2deg(np.arcsin(sin_lats))[::-1]
+    ring_points = 20 + 4 * np.minimum(np.arange(16), np.arange(16)[::-1])
+    latitudes = np.repeat(ring_lats, ring_points)
+
+    areas = helpers.cubes.reduced_grid_areas(latitudes)
+    assert areas.shape == latitudes.shape
+    # all points on a ring have the same area, mirrored about the equator
+    assert np.allclose(areas, areas[::-1])
+    assert np.allclose(areas[: ring_points[0]], areas[0])
+    earth_radius = 6.371229e6
+    assert areas.sum() == pytest.approx(4 * np.pi * earth_radius**2, rel=1e-2)
+
+    # computed once per grid
+    assert helpers.cubes.reduced_grid_areas(latitudes.copy()) is areas
+    cube = Cube(
+        np.zeros((2, latitudes.size)),
+        aux_coords_and_dims=[(AuxCoord(latitudes, standard_name="latitude"), 1)],
+    )
+    assert helpers.cubes.compute_reduced_grid_weights(cube) is areas
+
+
+@pytest.mark.parametrize("operation", ["MEAN", "SUM"])
+@pytest.mark.parametrize(
+    "collapsed",
+    [("time",), ("latitude", "longitude"), ("time", "latitude", "longitude")],
+)
+@pytest.mark.parametrize("masked", [True, False])
+def test_weighted_aggregate(operation, collapsed, masked):
+    rng = np.random.default_rng(0)
+    data = np.ma.masked_less(rng.random((3, 4, 5), dtype=np.float32), 0.2)
+    data[:, 0, 0] = np.ma.masked  # masked at all times
+    if not masked:
+        data = np.ma.getdata(data)
+    time = DimCoord(
+        [15.0, 45.0, 74.0],
+        bounds=[[0.0, 31.0], [31.0, 59.0], [59.0, 90.0]],
+        standard_name="time",
+        units="days since 1990-01-01",
+    )
+    lat = DimCoord(np.linspace(-60, 60, 4), standard_name="latitude", units="degrees")
+    lon = DimCoord(np.linspace(0, 288, 5), standard_name="longitude", units="degrees")
+    cube = Cube(
+        data,
+        var_name="tos",
+        units="degC",
+        dim_coords_and_dims=[(time, 0), (lat, 1), (lon, 2)],
+    )
+    if collapsed == ("time",):
+        weights = helpers.cubes.compute_time_weights(cube)
+        full_weights = helpers.cubes.compute_time_weights(cube, cube.shape)
+    elif collapsed == ("latitude", "longitude"):
+        weights = rng.random((4, 5)) + 1
+        full_weights = np.broadcast_to(weights, cube.shape)
+    else:
+        weights = rng.random((3, 4, 5)) + 1
+        full_weights = weights
+    operation = getattr(iris.analysis, operation)
+
+    result = helpers.cubes.weighted_aggregate(cube, collapsed, weights, operation)
+    expected = cube.collapsed(list(collapsed), operation, weights=full_weights)
+    assert result.metadata == expected.metadata
+    assert result.coords() == expected.coords()
+    assert result.dtype == expected.dtype
+    assert np.array_equal(
+        np.ma.getmaskarray(result.data), np.ma.getmaskarray(expected.data)
+    )
+    assert np.ma.allclose(result.data, expected.data)
+
+    with pytest.raises(ValueError):
+        helpers.cubes.weighted_aggregate(cube, collapsed, weights[1:], operation)
+
+
+@pytest.mark.parametrize("operation", ["MEAN", "SUM"])
+def test_weighted_aggregate_weights_units(operation):
+    rng = np.random.default_rng(0)
+    cube = Cube(
+        np.ma.masked_less(rng.random((2, 4, 5)), 0.2),
+        var_name="tos",
+        units="kg m-2 s-1",
+        dim_coords_and_dims=[
+            (DimCoord(np.arange(n), long_name=name), dim)
+            for dim, (name, n) in enumerate(zip(("time", "y", "x"), (2, 4, 5)))
+        ],
+    )
+    weights = rng.random((4, 5)) + 1
+    cube.add_cell_measure(
+        iris.coords.CellMeasure(weights, var_name="cell_size", units="m2"), (1, 2)
+    )
+    operation = getattr(iris.analysis, operation)
+
+    result = helpers.cubes.weighted_aggregate(
+        cube, ["y", "x"], weights, operation, weights_units="m2"
+    )
+    expected = cube.collapsed(["y", "x"], operation, weights="cell_size")
+    assert result.units == expected.units
+    assert np.ma.allclose(result.data, expected.data)
+
+
+@pytest.mark.parametrize("operation", ["MEAN", "SUM"])
+@pytest.mark.parametrize("block_size", [1, 2, 5])
+def test_weighted_aggregate_blocks(operation, block_size):
+    rng = np.random.default_rng(0)
+    data = np.ma.masked_less(rng.random((2, 3, 4, 5)), 0.3)
+    data[:, 2] = np.ma.masked  # fully masked level
+    lazy_data = da.from_array(data, chunks=(2, 1, 4, 5), asarray=False)
+    cube = Cube(
+        lazy_data,
+        var_name="thetao",
+        units="degC",
+        dim_coords_and_dims=[
+            (DimCoord(np.arange(n), long_name=name), dim)
+            for dim, (name, n) in enumerate(
+                zip(("time", "depth", "y", "x"), (2, 3, 4, 5))
+            )
+        ],
+    )
+    weights = rng.random((3, 4, 5)) + 1
+    operation = getattr(iris.analysis, operation)
+
+    expected = helpers.cubes.weighted_aggregate(
+        cube, ["depth", "y", "x"], weights, operation
+    )
+    result = helpers.cubes.weighted_aggregate(
+        cube,
+        ["depth", "y", "x"],
+        weights,
+        operation,
+        block_dim=1,
+        block_size=block_size,
+    )
+    assert cube.has_lazy_data()
+    assert result.shape == (2,)
+    assert np.allclose(result.data, expected.data)
+    with pytest.raises(ValueError):
+        helpers.cubes.weighted_aggregate(
+            cube, ["y", "x"], weights[0], operation, block_dim=1
+        )
@@ -1,6 +1,9 @@
 """Tests for file handling and nemo helpers"""
 
+import errno
+import fcntl
 import os
+from pathlib import Path
 
 import iris
 import jinja2
@@ -10,7 +13,7 @@ from iris.coords import DimCoord
 from iris.cube import Cube, CubeList
 
 import helpers.nemo
-from helpers.files import ChangeDirectory, get_template
+from helpers.files import ChangeDirectory, FileLock, get_template
 
 
 def test_get_template(tmp_path):
@@ -33,6 +36,28 @@ def test_change_directory(tmpdir):
     assert os.getcwd() == cwd
 
 
+def test_file_lock(tmp_path):
+    dst = tmp_path / "dst.nc"
+    with FileLock(dst):
+        with open(f"{dst}.lock") as lock_file:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    assert not Path(f"{dst}.lock").exists()
+
+
+def test_file_lock_unsupported(tmp_path, monkeypatch):
+    def flock(file, operation):
+        raise OSError(errno.ENOLCK, "No locks available")
+
+    monkeypatch.setattr(fcntl, "flock", flock)
+    dst = tmp_path / "dst.nc"
+    with pytest.warns(UserWarning, match="Cannot lock"):
+        with FileLock(dst):
+            dst.touch()
+    assert dst.exists()
+    assert not Path(f"{dst}.lock").exists()
+
+
 def test_2d_spatial_weights(tmp_path):
     data = Cube(
         [[1.0]],
@@ -51,8 +76,10 @@ def test_2d_spatial_weights(tmp_path):
     domain_file = str(tmp_path / "domain.nc")
     iris.save(domain, domain_file)
     expected_weights = np.array([6.0])
-    helpers.nemo._add_cell_size(data, domain_file, "t")
-    assert data.cell_measure("cell_size").data == expected_weights
+    weights = helpers.nemo.cell_weights(
+        domain_file, "t", is_3d=helpers.nemo.has_depth(data)
+    )
+    assert weights == expected_weights
 
 
 def test_3d_spatial_weights(tmp_path):
@@ -80,5 +107,7 @@ def test_3d_spatial_weights(tmp_path):
     domain_file = str(tmp_path / "domain.nc")
     iris.save(domain, domain_file)
     expected_weights = np.array([24.0])
-    helpers.nemo._add_cell_size(data, domain_file, "t")
-    assert data.cell_measure("cell_size").data == expected_weights
+    weights = helpers.nemo.cell_weights(
+        domain_file, "t", is_3d=helpers.nemo.has_depth(data)
+    )
+    assert weights == expected_weights
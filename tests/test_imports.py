@@ -0,0 +1,66 @@
+"""Tests of the modules imported with the tasks"""
+
+import json
+import subprocess
+import sys
+import tomllib
+from pathlib import Path
+
+# Plotting libraries that processing tasks must not import
+_plotting_modules = (
+    "matplotlib",
+    "cartopy.mpl",
+    "iris.plot",
+    "iris.quickplot",
+    "imageio",
+    "PIL",
+)
+
+
+def _task_modules():
+    pyproject = Path(__file__).parents[1] / "pyproject.toml"
+    with open(pyproject, "rb") as pyproject_file:
+        entry_points = tomllib.load(pyproject_file)["project"]["entry-points"]
+    return sorted(
+        {
+            value.partition(":")[0]
+            for value in entry_points["scriptengine.tasks"].values()
+        }
+    )
+
+
+def _import(modules):
+    """
+    Import modules in a new interpreter, as ScriptEngine loads the tasks, and
+    return the plotting modules that were imported
+    """
+    code = f"""
+import json, sys
+for module in {modules!r}:
+    __import__(module)
+print(json.dumps([m for m in {_plotting_modules!r} if m in sys.modules]))
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        cwd=Path(__file__).parents[1],
+        text=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_tasks_do_not_import_plotting():
+    # loading the tasks is fast if the plotting libraries are left out
+    assert _import(_task_modules()) == []
+
+
+def test_presentation_imports_plotting():
+    # the test above would pass trivially if the names were wrong
+    assert set(_import(["helpers.presentation_objects"])) == {
+        "matplotlib",
+        "cartopy.mpl",
+        "iris.plot",
+        "iris.quickplot",
+        "PIL",
+    }
@@ -2,10 +2,13 @@
 
 from pathlib import Path
 
+import cf_units
 import iris
+import numpy as np
 import pytest
 import scriptengine.exceptions
 
+from helpers.presentation_objects import MapLoader, get_loader
 from monitoring.map import Map
 
 
@@ -37,3 +40,177 @@ def test_map_nonmonotonic_increase(tmp_path):
         old_cube,
         out_path,
     )
+
+
+def _map_cube(data, bounds):
+    time = iris.coords.DimCoord(
+        [sum(bounds) / 2],
+        bounds=[bounds],
+        standard_name="time",
+        units=cf_units.Unit("days since 1990-01-01", calendar="standard"),
+        climatological=True,
+    )
+    return iris.cube.Cube(
+        np.ma.masked_invalid(np.array(data, dtype="float32")),
+        var_name="tos",
+        units="degC",
+        aux_coords_and_dims=[(time, None)],
+    )
+
+
+def test_map_running_mean(tmp_path):
+    dst = tmp_path / "test.nc"
+    test_map = Map({})
+    test_map.save(_map_cube([1.0, np.nan], [0.0, 100.0]), dst)
+    test_map.save(_map_cube([4.0, 2.0], [100.0, 400.0]), dst)
+
+    cube = iris.load_cube(str(dst))
+    assert cube.attributes["diagnostic_type"] == "map"
+    # the average is published in the dtype of the legs
+    assert cube.dtype == np.float32
+    # second point is masked in the first leg and gets only the second leg's weight
+    assert np.allclose(cube.data, [(1.0 * 100 + 4.0 * 300) / 400, 2.0])
+    weights = cube.ancillary_variable("sum of time weights over all legs")
+    assert (weights.data == [400.0, 300.0]).all()
+    assert weights.units == "days"
+    assert (cube.coord("time").bounds == [[0.0, 400.0]]).all()
+    assert cube.coord("time").points == [200.0]
+
+    test_map.save(_map_cube([0.0, 0.0], [400.0, 500.0]), dst)
+    cube = iris.load_cube(str(dst))
+    assert np.allclose(cube.data, [1300.0 / 500, 600.0 / 400])
+
+
+def test_map_running_mean_without_weights(tmp_path):
+    dst = tmp_path / "test.nc"
+    # maps without time weights are continued with the length of the time bounds
+    iris.save(_map_cube([1.0, 1.0], [0.0, 100.0]), str(dst))
+    test_map = Map({})
+    test_map.save(_map_cube([3.0, 5.0], [100.0, 200.0]), dst)
+
+    cube = iris.load_cube(str(dst))
+    assert (cube.data == [2.0, 3.0]).all()
+    # with the same coverage at all points, a scalar time weight is stored
+    weights = cube.ancillary_variable("sum of time weights over all legs")
+    assert weights.shape == (1,)
+    assert weights.data == [200.0]
+
+
+def test_map_replace_overlap(tmp_path):
+    dst = tmp_path / "test.nc"
+    test_map = Map({})
+    # a first leg that is run again replaces the map
+    test_map.save(_map_cube([7.0, 7.0], [0.0, 100.0]), dst, replace_overlap=True)
+    test_map.save(_map_cube([1.0, np.nan], [0.0, 100.0]), dst, replace_overlap=True)
+    test_map.save(_map_cube([9.0, 9.0], [100.0, 200.0]), dst, replace_overlap=True)
+    # the map before the last leg is stored in the dtype of the legs
+    previous_map = iris.load_cube(str(dst)).ancillary_variable(
+        "map before the last leg"
+    )
+    assert previous_map.dtype == np.float32
+    # a later leg that is run again replaces its part of the average
+    test_map.save(_map_cube([3.0, 5.0], [100.0, 200.0]), dst, replace_overlap=True)
+    test_map.save(_map_cube([3.0, 5.0], [100.0, 200.0]), dst, replace_overlap=True)
+    cube = iris.load_cube(str(dst))
+    assert (cube.data == [2.0, 5.0]).all()
+    assert (
+        cube.ancillary_variable("sum of time weights over all legs").data
+        == [200.0, 100.0]
+    ).all()
+    assert (cube.coord("time").bounds == [[0.0, 200.0]]).all()
+
+    # the next leg is added as usual
+    test_map.save(_map_cube([6.0, 8.0], [200.0, 300.0]), dst, replace_overlap=True)
+    cube = iris.load_cube(str(dst))
+    assert np.allclose(cube.data, [10.0 / 3, 6.5])
+
+
+def test_map_replace_overlap_without_previous_map(tmp_path):
+    dst = tmp_path / "test.nc"
+    # without replace_overlap, the map before the last leg is not stored
+    test_map = Map({})
+    test_map.save(_map_cube([1.0, 1.0], [0.0, 100.0]), dst)
+    test_map.save(_map_cube([2.0, 3.0], [100.0, 200.0]), dst)
+    assert len(iris.load_cube(str(dst)).ancillary_variables()) == 1
+    pytest.raises(
+        scriptengine.exceptions.ScriptEngineTaskRunError,
+        test_map.save,
+        _map_cube([3.0, 5.0], [100.0, 200.0]),
+        dst,
+        replace_overlap=True,
+    )
+
+    # maps of earlier versions do not store the map before the last leg
+    iris.save(_map_cube([2.0, 3.0], [0.0, 200.0]), str(dst))
+    pytest.raises(
+        scriptengine.exceptions.ScriptEngineTaskRunError,
+        test_map.save,
+        _map_cube([3.0, 5.0], [100.0, 200.0]),
+        dst,
+        replace_overlap=True,
+    )
+
+
+def test_map_statistics(tmp_path):
+    statistics = {
+        "std": str(tmp_path / "std.nc"),
+        "min": str(tmp_path / "min.nc"),
+        "max": str(tmp_path / "max.nc"),
+    }
+    legs = (([1.0, np.nan], [0.0, 100.0]), ([4.0, 2.0], [100.0, 400.0]))
+    legs += (([0.0, 6.0], [400.0, 500.0]),)
+    test_map = Map({})
+    test_map.check_statistics(statistics)
+    for data, bounds in legs:
+        leg_cube = _map_cube(data, bounds)
+        leg_cube.attributes["map_type"] = "global ocean"
+        test_map.save_statistics(leg_cube, statistics)
+
+    std_cube = iris.load_cube(statistics["std"])
+    expected_std = [
+        np.sqrt(np.cov([1.0, 4.0, 0.0], aweights=[100, 300, 100], ddof=0)),
+        np.sqrt(np.cov([2.0, 6.0], aweights=[300, 100], ddof=0)),
+    ]
+    assert np.allclose(std_cube.data, expected_std)
+    assert std_cube.long_name == "tos standard deviation"
+    assert std_cube.attributes["diagnostic_type"] == "map"
+    assert (std_cube.coord("time").bounds == [[0.0, 500.0]]).all()
+    assert (iris.load_cube(statistics["min"]).data == [0.0, 2.0]).all()
+    assert (iris.load_cube(statistics["max"]).data == [4.0, 6.0]).all()
+    assert isinstance(get_loader(Path(statistics["max"])), MapLoader)
+
+
+def test_map_statistics_replace_overlap(tmp_path):
+    legs = [
+        ([1.0, np.nan], [0.0, 100.0]),
+        ([4.0, 2.0], [100.0, 400.0]),
+        ([0.0, 6.0], [400.0, 500.0]),
+    ]
+    test_map = Map({})
+    results = {}
+    for name, rerun in (("expected", None), ("rerun", ([9.0, -9.0], [400.0, 500.0]))):
+        statistics = {
+            statistic: str(tmp_path / f"{name}_{statistic}.nc")
+            for statistic in ("std", "min", "max")
+        }
+        # the rerun leg first saves other data, then is run again
+        for data, bounds in legs[:2] + ([rerun] if rerun else []) + legs[2:]:
+            test_map.save_statistics(
+                _map_cube(data, bounds), statistics, replace_overlap=True
+            )
+        results[name] = {
+            statistic: iris.load_cube(dst) for statistic, dst in statistics.items()
+        }
+    for statistic, cube in results["rerun"].items():
+        assert np.allclose(cube.data, results["expected"][statistic].data)
+        assert (cube.coord("time").bounds == [[0.0, 500.0]]).all()
+
+
+def test_map_invalid_statistics():
+    test_map = Map({})
+    for statistics in (["std"], {"variance": "var.nc"}, {"std": "std.yml"}):
+        pytest.raises(
+            scriptengine.exceptions.ScriptEngineTaskArgumentInvalidError,
+            test_map.check_statistics,
+            statistics,
+        )
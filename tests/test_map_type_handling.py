@@ -1,7 +1,19 @@
 """Tests for helpers/map_type_handling.py"""
 
+import io
+import warnings
+from unittest import mock
+
+import cartopy.crs as ccrs
+import cartopy.img_transform
+import cartopy.mpl.geoaxes
 import iris
+import iris.analysis.cartography
+import iris.coords
+import iris.cube
 import matplotlib.pyplot as plt
+import numpy as np
+import pytest
 
 import helpers.map_type_handling as mth
 
@@ -26,3 +38,182 @@ def test_function_mapper():
     assert mth.function_mapper("global atmosphere") == mth.global_atmosphere_plot
     assert mth.function_mapper("polar ice sheet") == mth.polar_ice_sheet_plot
     assert mth.function_mapper("invalid") is None
+
+
+def test_project_to_plate_carree(tmp_path, monkeypatch):
+    monkeypatch.setenv("ECE_MONITORING_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(mth, "_projection_indices", {})
+    # curvilinear, ORCA-like grid
+    j, i = np.mgrid[0:30, 0:40]
+    lon = (9.0 * i + np.sin(j / 5)) % 360 - 100
+    lat = -75 + 5.0 * j + np.cos(i / 3)
+    data = np.ma.masked_greater(np.random.default_rng(0).random((30, 40)), 0.8)
+    cube = iris.cube.Cube(
+        data.astype(np.float32),
+        long_name="sea surface temperature",
+        units="degC",
+        aux_coords_and_dims=[
+            (
+                iris.coords.AuxCoord(lat, standard_name="latitude", units="degrees"),
+                (0, 1),
+            ),
+            (
+                iris.coords.AuxCoord(lon, standard_name="longitude", units="degrees"),
+                (0, 1),
+            ),
+        ],
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected, _ = iris.analysis.cartography.project(
+            cube, ccrs.PlateCarree(), nx=80, ny=40
+        )
+        projected = mth.project_to_plate_carree(cube, nx=80, ny=40)
+    assert len(list(tmp_path.glob("projection_index_*.npy"))) == 1
+    assert projected.metadata == expected.metadata
+    assert projected.dtype == expected.dtype
+    for name in ("projection_x_coordinate", "projection_y_coordinate"):
+        assert projected.coord(name) == expected.coord(name)
+    assert np.array_equal(
+        np.ma.getmaskarray(projected.data), np.ma.getmaskarray(expected.data)
+    )
+    assert np.ma.allequal(projected.data, expected.data)
+
+    # later frames and processes reuse the index without a new search
+    monkeypatch.setattr(mth, "_projection_indices", {})
+    with mock.patch("cartopy.img_transform.regrid") as regrid:
+        cube.data = cube.data + 1
+        reprojected = mth.project_to_plate_carree(cube, nx=80, ny=40)
+    regrid.assert_not_called()
+    assert np.ma.allclose(reprojected.data, expected.data + 1)
+
+
+@pytest.mark.parametrize("north", [True, False])
+def test_project_to_polar_stereo(monkeypatch, north):
+    monkeypatch.setattr(mth, "_projection_indices", {})
+    cube = _curvilinear_cube(np.zeros((30, 40)), "Sea ice thickness")
+    cube.data = cube.coord("latitude").points
+    regrid = cartopy.img_transform.regrid
+    with mock.patch("cartopy.img_transform.regrid", side_effect=regrid) as search:
+        projected = mth.project_to_polar_stereo(cube, north, nx=60, ny=60)
+    # only the grid points of one hemisphere are searched
+    source_lat = search.call_args.args[2]
+    assert np.all(source_lat > 35.0 if north else source_lat < -35.0)
+    assert projected.shape == (60, 60)
+    assert np.all(projected.data > 35.0 if north else projected.data < -35.0)
+    # the grid point closest to the pole is shown
+    pole = np.max(cube.data) if north else np.min(cube.data)
+    assert np.any(projected.data == pole)
+
+    monkeypatch.setattr(mth, "_projection_indices", {})
+    with mock.patch("cartopy.img_transform.regrid") as search:
+        reprojected = mth.project_to_polar_stereo(cube, north, nx=60, ny=60)
+    search.assert_not_called()
+    assert np.array_equal(reprojected.data, projected.data)
+
+
+def _curvilinear_cube(data, long_name):
+    j, i = np.mgrid[0:30, 0:40]
+    return iris.cube.Cube(
+        data,
+        long_name=long_name,
+        units="m",
+        aux_coords_and_dims=[
+            (
+                iris.coords.AuxCoord(
+                    -75 + 5.0 * j + np.cos(i / 3), "latitude", units="degrees"
+                ),
+                (0, 1),
+            ),
+            (
+                iris.coords.AuxCoord(
+                    (9.0 * i + np.sin(j / 5)) % 360 - 100, "longitude", units="degrees"
+                ),
+                (0, 1),
+            ),
+        ],
+    )
+
+
+def _points_cube(data, long_name):
+    lat, lon = np.meshgrid(np.linspace(-85, 85, 30), np.linspace(0, 355, 40))
+    return iris.cube.Cube(
+        data.reshape(-1),
+        long_name=long_name,
+        units="K",
+        aux_coords_and_dims=[
+            (iris.coords.AuxCoord(lat.reshape(-1), "latitude", units="degrees"), 0),
+            (iris.coords.AuxCoord(lon.reshape(-1), "longitude", units="degrees"), 0),
+        ],
+    )
+
+
+def _png(fig):
+    png = io.BytesIO()
+    fig.savefig(png, format="png", bbox_inches="tight")
+    return png.getvalue()
+
+
+@pytest.mark.parametrize(
+    "map_type, make_cube, value_range",
+    [
+        ("global ocean", _curvilinear_cube, [None, None]),
+        ("global atmosphere", _points_cube, [0, None]),
+        ("polar ice sheet", _curvilinear_cube, [None, 2.0]),
+    ],
+)
+def test_map_renderer(monkeypatch, map_type, make_cube, value_range):
+    # coastlines would be downloaded
+    monkeypatch.setattr(cartopy.mpl.geoaxes.GeoAxes, "coastlines", mock.Mock())
+    rng = np.random.default_rng(0)
+    frames = [
+        (
+            make_cube(rng.random((30, 40)) * (1 + ts), "Sea ice thickness North"),
+            f"{1990 + ts}",
+        )
+        for ts in range(3)
+    ]
+    renderer = mth.MapRenderer(map_type, value_range=value_range, colormap="viridis")
+    for cube, dates in frames:
+        rendered = _png(renderer.render(cube, title="Title", dates=dates, units="m"))
+        fig = mth.function_mapper(map_type)(
+            cube,
+            title="Title",
+            dates=dates,
+            units="m",
+            value_range=value_range,
+            colormap="viridis",
+        )
+        assert rendered == _png(fig)
+        plt.close(fig)
+        assert len(plt.get_fignums()) == 1
+    renderer.close()
+    assert not plt.get_fignums()
+
+
+def test_reduced_grid_cells(monkeypatch):
+    monkeypatch.setattr(mth, "_reduced_grid_cells", {})
+    # two rings of 4 and one ring of 2 points, from north to south
+    lat = np.array([45.0] * 4 + [0.0] * 4 + [-45.0] * 2)
+    lon = np.array([0.0, 90.0, 180.0, 270.0, 45.0, 135.0, 225.0, 315.0, 0.0, 180.0])
+    vertices, index = mth.reduced_grid_cells(lat, lon)
+    # the cells at 180 degrees cross the date line and are repeated
+    np.testing.assert_array_equal(index, np.append(np.arange(10), [2, 9]))
+    np.testing.assert_array_equal(
+        vertices[0], [[-45.0, 22.5], [45.0, 22.5], [45.0, 90.0], [-45.0, 90.0]]
+    )
+    np.testing.assert_array_equal(
+        vertices[6], [[-180.0, -22.5], [-90.0, -22.5], [-90.0, 22.5], [-180.0, 22.5]]
+    )
+    np.testing.assert_array_equal(
+        vertices[-1], [[90.0, -90.0], [270.0, -90.0], [270.0, -22.5], [90.0, -22.5]]
+    )
+    # the polygons cover the globe once, apart from the repeated parts
+    width = vertices[:, 1, 0] - vertices[:, 0, 0]
+    height = vertices[:, 2, 1] - vertices[:, 1, 1]
+    inside = np.clip(vertices[:, 1, 0], -180, 180) - np.clip(
+        vertices[:, 0, 0], -180, 180
+    )
+    assert np.all(width > 0)
+    assert np.sum(inside * height) == 360.0 * 180.0
+    assert mth.reduced_grid_cells(lat, lon)[0] is vertices
@@ -0,0 +1,102 @@
+"""Tests for NEMO helpers"""
+
+from unittest import mock
+
+import dask.array as da
+import iris
+import iris.analysis
+import iris.coords
+import iris.cube
+import numpy as np
+import pytest
+
+import helpers.nemo
+
+
+def _domain_file(tmp_path):
+    rng = np.random.default_rng(0)
+    domain = tmp_path / "domain_cfg.nc"
+    iris.save(
+        [
+            iris.cube.Cube(rng.random(shape) + 1, var_name=name, units="m")
+            for name, shape in (
+                ("e1t", (1, 2, 3)),
+                ("e2t", (1, 2, 3)),
+                ("e3t_0", (1, 4, 2, 3)),
+            )
+        ],
+        str(domain),
+    )
+    return domain
+
+
+def test_cell_weights(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("ECE_MONITORING_CACHE_DIR", str(cache_dir))
+    domain = _domain_file(tmp_path)
+    e1, e2, e3 = (
+        iris.load_cube(str(domain), name).data[0] for name in ("e1t", "e2t", "e3t_0")
+    )
+
+    area = helpers.nemo.cell_weights(domain, "T", is_3d=False)
+    volume = helpers.nemo.cell_weights(str(domain), "t", is_3d=True)
+    assert area.dtype == np.float32
+    assert np.allclose(area, e1 * e2)
+    # the volume is computed lazily from the cached area and thickness
+    assert isinstance(volume, da.Array)
+    assert volume.dtype == np.float32
+    assert np.allclose(volume.compute(), e1 * e2 * e3)
+    assert len(list(cache_dir.glob("*.npy"))) == 2
+
+    # second use reads the cache, memory-mapped
+    with mock.patch("netCDF4.Dataset") as dataset:
+        cached_area = helpers.nemo.cell_weights(domain, "T", is_3d=False)
+        cached_volume = helpers.nemo.cell_weights(domain, "T", is_3d=True)
+    dataset.assert_not_called()
+    assert isinstance(cached_area, np.memmap)
+    assert np.array_equal(cached_volume.compute(), volume.compute())
+
+
+def test_cell_weights_unwritable_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    cache_dir.write_text("not a directory")
+    monkeypatch.setenv("ECE_MONITORING_CACHE_DIR", str(cache_dir))
+    domain = _domain_file(tmp_path)
+    with pytest.warns(UserWarning, match="Could not cache"):
+        area = helpers.nemo.cell_weights(domain, "T", is_3d=False)
+    assert area.shape == (2, 3)
+
+
+def test_compute_global_aggregate_levels_per_block(tmp_path):
+    domain = _domain_file(tmp_path)
+    rng = np.random.default_rng(1)
+    cube = iris.cube.Cube(
+        np.ma.masked_less(rng.random((2, 4, 2, 3)), 0.2),
+        var_name="thetao",
+        units="degC",
+        dim_coords_and_dims=[
+            (iris.coords.DimCoord([0.0, 1.0], standard_name="time", units="days"), 0),
+            (iris.coords.DimCoord([1.0, 5.0, 10.0, 20.0], var_name="deptht"), 1),
+        ],
+        aux_coords_and_dims=[
+            (
+                iris.coords.AuxCoord(rng.random((2, 3)), standard_name="latitude"),
+                (2, 3),
+            ),
+            (
+                iris.coords.AuxCoord(rng.random((2, 3)), standard_name="longitude"),
+                (2, 3),
+            ),
+        ],
+    )
+    for operation in (iris.analysis.MEAN, iris.analysis.SUM):
+        expected = helpers.nemo.compute_global_aggregate(
+            cube.copy(), domain, "T", operation
+        )
+        streamed = helpers.nemo.compute_global_aggregate(
+            cube.copy(), domain, "T", operation, levels_per_block=1
+        )
+        assert streamed.shape == (2,)
+        assert np.allclose(streamed.data, expected.data)
+        assert streamed.units == expected.units
+    assert expected.units == "degC m3"
@@ -1,14 +1,21 @@
 """Tests for monitoring/nemo_global_mean_year_mean_timeseries.py"""
 
+from unittest import mock
+
 import cf_units
 import iris
+import iris.coords
+import iris.cube
 import numpy as np
 import pytest
 import scriptengine.exceptions
 
+import helpers.cache
+import helpers.nemo
 from monitoring.nemo_timeseries import (
     NemoGlobalMeanYearMeanTimeseries,
     NemoGlobalSumYearMeanTimeseries,
+    NemoMultiTimeseries,
     NemoYearMeanTimeseries,
 )
 
@@ -97,3 +104,183 @@ def test_nemo_year_mean_timeseries_working(tmp_path):
     assert out_cube.cell_methods == (
         iris.coords.CellMethod("mean", coords="time", intervals="1 year"),
     )
+
+
+def _nemo_files(tmp_path):
+    """Write synthetic NEMO output (two months, 2x3 grid) and domain files."""
+    time = iris.coords.DimCoord(
+        [15.0, 45.0],
+        bounds=[[0.0, 31.0], [31.0, 59.0]],
+        standard_name="time",
+        units=cf_units.Unit("days since 1990-01-01", calendar="standard"),
+    )
+    lat = iris.coords.AuxCoord(
+        np.array([[-10.0, -10.0, -10.0], [10.0, 10.0, 10.0]]),
+        standard_name="latitude",
+        units="degrees",
+    )
+    lon = iris.coords.AuxCoord(
+        np.array([[0.0, 120.0, 240.0], [0.0, 120.0, 240.0]]),
+        standard_name="longitude",
+        units="degrees",
+    )
+    rng = np.random.default_rng(0)
+    cubes = iris.cube.CubeList(
+        iris.cube.Cube(
+            rng.random((2, 2, 3)),
+            standard_name=standard_name,
+            var_name=var_name,
+            units=units,
+            dim_coords_and_dims=[(time, 0)],
+            aux_coords_and_dims=[(lat, (1, 2)), (lon, (1, 2))],
+        )
+        for var_name, standard_name, units in (
+            ("tos", "sea_surface_temperature", "degC"),
+            ("sos", "sea_surface_salinity", "1e-3"),
+        )
+    )
+    cubes.append(
+        iris.cube.Cube(
+            rng.random(2),
+            long_name="total denitrification",
+            var_name="tdenit",
+            units="1",
+            dim_coords_and_dims=[(time, 0)],
+        )
+    )
+    src = tmp_path / "nemo_grid_T.nc"
+    iris.save(cubes, str(src))
+    domain = tmp_path / "domain.nc"
+    iris.save(
+        [
+            iris.cube.Cube(rng.random((1, 2, 3)) + 1, var_name=name, units="m")
+            for name in ("e1t", "e2t")
+        ],
+        str(domain),
+    )
+    return str(src), str(domain)
+
+
+def test_nemo_multi_timeseries(tmp_path):
+    src, domain = _nemo_files(tmp_path)
+    diagnostics = [
+        {"varname": "tos", "operation": "global_mean", "dst": "tos_mean.nc"},
+        {"varname": "tos", "operation": "global_sum", "dst": "tos_sum.nc"},
+        {"varname": "sos", "operation": "global_mean", "dst": "sos_mean.nc"},
+        {"varname": "tdenit", "operation": "year_mean", "dst": "tdenit.nc"},
+    ]
+    for diagnostic in diagnostics:
+        diagnostic["dst"] = str(tmp_path / diagnostic["dst"])
+    init = {"src": [src], "domain": domain, "diagnostics": diagnostics}
+    NemoMultiTimeseries(init).run(init)
+
+    single_tasks = {
+        "global_mean": NemoGlobalMeanYearMeanTimeseries,
+        "global_sum": NemoGlobalSumYearMeanTimeseries,
+        "year_mean": NemoYearMeanTimeseries,
+    }
+    for diagnostic in diagnostics:
+        single = {
+            "src": [src],
+            "domain": domain,
+            "varname": diagnostic["varname"],
+            "dst": str(tmp_path / "single.nc"),
+        }
+        single_tasks[diagnostic["operation"]](single).run(single)
+        expected = iris.load_cube(single["dst"])
+        cube = iris.load_cube(diagnostic["dst"])
+        assert cube.metadata == expected.metadata
+        assert cube.coord("time") == expected.coord("time")
+        assert np.allclose(cube.data, expected.data)
+        (tmp_path / "single.nc").unlink()
+
+
+def test_nemo_timeseries_levels_per_block_lazy(tmp_path):
+    # a 3D variable, large enough for Iris to load the data lazily
+    shape = (2, 3, 30, 30)
+    time = iris.coords.DimCoord(
+        [15.0, 45.0],
+        bounds=[[0.0, 31.0], [31.0, 59.0]],
+        standard_name="time",
+        units=cf_units.Unit("days since 1990-01-01", calendar="standard"),
+    )
+    depth = iris.coords.DimCoord(
+        [5.0, 15.0, 25.0],
+        var_name="deptht",
+        long_name="Vertical T levels",
+        units="m",
+    )
+    lat, lon = np.meshgrid(np.linspace(-80, 80, 30), np.linspace(0, 348, 30))
+    rng = np.random.default_rng(0)
+    src = str(tmp_path / "nemo_grid_T.nc")
+    iris.save(
+        iris.cube.Cube(
+            rng.random(shape),
+            standard_name="sea_surface_temperature",
+            var_name="tos",
+            units="degC",
+            dim_coords_and_dims=[(time, 0), (depth, 1)],
+            aux_coords_and_dims=[
+                (iris.coords.AuxCoord(lat, standard_name="latitude"), (2, 3)),
+                (iris.coords.AuxCoord(lon, standard_name="longitude"), (2, 3)),
+            ],
+        ),
+        src,
+    )
+    domain = str(tmp_path / "domain.nc")
+    iris.save(
+        [
+            iris.cube.Cube(rng.random((1, *shape[2:])) + 1, var_name=name, units="m")
+            for name in ("e1t", "e2t")
+        ]
+        + [iris.cube.Cube(rng.random((1, *shape[1:])) + 1, var_name="e3t_0")],
+        domain,
+    )
+    calls = []
+
+    def weighted_aggregate(cube, coords, weights, operation, block_dim=None, **kwargs):
+        calls.append((cube.has_lazy_data(), block_dim))
+        return aggregate(cube, coords, weights, operation, block_dim, **kwargs)
+
+    aggregate = helpers.cubes.weighted_aggregate
+    single = {
+        "src": [src],
+        "domain": domain,
+        "varname": "tos",
+        "dst": str(tmp_path / "single.nc"),
+        "levels_per_block": 1,
+    }
+    multi = {
+        "src": [src],
+        "domain": domain,
+        "diagnostics": [
+            {
+                "varname": "tos",
+                "operation": "global_sum",
+                "dst": str(tmp_path / "multi.nc"),
+            }
+        ],
+        "levels_per_block": 1,
+    }
+    with mock.patch("helpers.cubes.weighted_aggregate", weighted_aggregate):
+        NemoGlobalMeanYearMeanTimeseries(single).run(single)
+        NemoMultiTimeseries(multi).run(multi)
+    # the lazy data is reduced level by level along depth, then over time
+    assert [call for call in calls if call[0]] == [(True, 1), (True, 1)]
+    assert helpers.cache.input_cubes.get((helpers.cache.file_key([src]), "tos")) is None
+
+
+def test_nemo_multi_timeseries_invalid_operation(tmp_path):
+    src, domain = _nemo_files(tmp_path)
+    init = {
+        "src": [src],
+        "domain": domain,
+        "diagnostics": [
+            {"varname": "tos", "operation": "median", "dst": str(tmp_path / "a.nc")}
+        ],
+    }
+    pytest.raises(
+        scriptengine.exceptions.ScriptEngineTaskArgumentInvalidError,
+        NemoMultiTimeseries(init).run,
+        init,
+    )
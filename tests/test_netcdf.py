@@ -0,0 +1,167 @@
+"""Tests for helpers/netcdf.py"""
+
+import cf_units
+import iris
+import iris.coords
+import numpy as np
+import pytest
+from iris.coords import DimCoord
+from iris.cube import Cube
+
+import helpers.netcdf
+
+
+def _time_cube(points, unit="days since 1990-01-01"):
+    time = DimCoord(
+        points,
+        standard_name="time",
+        units=cf_units.Unit(unit, calendar="standard"),
+        bounds=[[p - 0.5, p + 0.5] for p in points],
+        attributes={"time_origin": unit[11:]},
+    )
+    return Cube(
+        np.array(points, dtype="float64"),
+        var_name="foo",
+        dim_coords_and_dims=[(time, 0)],
+    )
+
+
+def test_diagnostic_attributes(tmp_path):
+    cube = _time_cube([1.0, 2.0])
+    cube.attributes = {"diagnostic_type": "time series", "title": "Title"}
+    iris.save(cube, str(tmp_path / "global.nc"))
+    attributes = helpers.netcdf.diagnostic_attributes(tmp_path / "global.nc")
+    assert attributes["diagnostic_type"] == "time series"
+    assert attributes["title"] == "Title"
+    # attributes on the data variable, as written for split attributes
+    with iris.FUTURE.context(save_split_attrs=True):
+        cube.attributes.locals.update(cube.attributes.globals)
+        cube.attributes.globals.clear()
+        iris.save(cube, str(tmp_path / "local.nc"))
+    attributes = helpers.netcdf.diagnostic_attributes(tmp_path / "local.nc")
+    assert attributes["diagnostic_type"] == "time series"
+    assert attributes["title"] == "Title"
+    with pytest.raises(OSError):
+        helpers.netcdf.diagnostic_attributes(tmp_path / "missing.nc")
+
+
+def test_unlimited_dimension(tmp_path):
+    fixed, unlimited = str(tmp_path / "fixed.nc"), str(tmp_path / "unlimited.nc")
+    iris.save(_time_cube([1.0]), fixed)
+    iris.save(_time_cube([1.0]), unlimited, unlimited_dimensions=["time"])
+    assert helpers.netcdf.unlimited_dimension(fixed) is None
+    assert helpers.netcdf.unlimited_dimension(unlimited) == "time"
+    pytest.raises(OSError, helpers.netcdf.unlimited_dimension, tmp_path / "no.nc")
+
+
+def test_append_records(tmp_path):
+    dst, src = str(tmp_path / "dst.nc"), str(tmp_path / "src.nc")
+    iris.save(_time_cube([1.0]), dst, unlimited_dimensions=["time"])
+    iris.save(_time_cube([2.0, 3.0]), src, unlimited_dimensions=["time"])
+    helpers.netcdf.append_records(src, dst, "time")
+    cube = iris.load_cube(dst)
+    assert (cube.data == [1.0, 2.0, 3.0]).all()
+    assert (cube.coord("time").bounds[:, 0] == [0.5, 1.5, 2.5]).all()
+
+
+def test_append_records_mismatch(tmp_path):
+    dst, src = str(tmp_path / "dst.nc"), str(tmp_path / "src.nc")
+    iris.save(_time_cube([1.0]), dst, unlimited_dimensions=["time"])
+    other = _time_cube([2.0])
+    other.var_name = "bar"
+    iris.save(other, src, unlimited_dimensions=["time"])
+    pytest.raises(ValueError, helpers.netcdf.append_records, src, dst, "time")
+
+
+def test_insert_records(tmp_path):
+    dst, src = str(tmp_path / "dst.nc"), str(tmp_path / "src.nc")
+    iris.save(_time_cube([1.0, 4.0, 5.0]), dst, unlimited_dimensions=["time"])
+    iris.save(_time_cube([2.0, 3.0]), src, unlimited_dimensions=["time"])
+    helpers.netcdf.insert_records(src, dst, "time", 1)
+    cube = iris.load_cube(dst)
+    assert (cube.data == [1.0, 2.0, 3.0, 4.0, 5.0]).all()
+    time = helpers.netcdf.record_coord(dst, "time")
+    assert (time.points == [1.0, 2.0, 3.0, 4.0, 5.0]).all()
+    assert (time.bounds[:, 0] == [0.5, 1.5, 2.5, 3.5, 4.5]).all()
+    pytest.raises(ValueError, helpers.netcdf.insert_records, src, dst, "time", 6)
+
+
+def test_insert_records_in_blocks(tmp_path, monkeypatch):
+    # the later records are moved back one at a time
+    monkeypatch.setattr(helpers.netcdf, "_move_block_bytes", 1)
+    dst, src = str(tmp_path / "dst.nc"), str(tmp_path / "src.nc")
+    iris.save(_time_cube([1.0, 4.0, 5.0, 6.0]), dst, unlimited_dimensions=["time"])
+    iris.save(_time_cube([2.0, 3.0]), src, unlimited_dimensions=["time"])
+    helpers.netcdf.insert_records(src, dst, "time", 1)
+    cube = iris.load_cube(dst)
+    assert (cube.data == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]).all()
+    assert (cube.coord("time").bounds[:, 0] == [0.5, 1.5, 2.5, 3.5, 4.5, 5.5]).all()
+
+
+def test_insert_records_interrupted(tmp_path, monkeypatch):
+    dst, src = str(tmp_path / "dst.nc"), str(tmp_path / "src.nc")
+    iris.save(_time_cube([1.0, 4.0]), dst, unlimited_dimensions=["time"])
+    iris.save(_time_cube([2.0, 3.0]), src, unlimited_dimensions=["time"])
+    with open(dst, "rb") as f:
+        stored = f.read()
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(helpers.netcdf, "_write_records", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        helpers.netcdf.insert_records(src, dst, "time", 1)
+    # dst is untouched and the copy is removed
+    with open(dst, "rb") as f:
+        assert f.read() == stored
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["dst.nc", "src.nc"]
+
+
+def test_replace_records(tmp_path):
+    dst, src = str(tmp_path / "dst.nc"), str(tmp_path / "src.nc")
+    iris.save(_time_cube([1.0, 2.0, 3.0]), dst, unlimited_dimensions=["time"])
+    new_cube = _time_cube([2.0, 3.0])
+    new_cube.data = new_cube.data * 10
+    iris.save(new_cube, src, unlimited_dimensions=["time"])
+    helpers.netcdf.replace_records(src, dst, "time")
+    cube = iris.load_cube(dst)
+    assert (cube.data == [1.0, 20.0, 30.0]).all()
+    last_time = helpers.netcdf.last_record_coord(dst, "time", count=2)
+    assert (last_time.points == [2.0, 3.0]).all()
+
+
+def test_last_record_coord(tmp_path):
+    dst = str(tmp_path / "dst.nc")
+    iris.save(_time_cube([1.0, 2.0, 3.0]), dst, unlimited_dimensions=["time"])
+    last_time = helpers.netcdf.last_record_coord(dst, "time")
+    assert last_time.points == [3.0]
+    assert (last_time.bounds == [[2.5, 3.5]]).all()
+    assert last_time.units == cf_units.Unit(
+        "days since 1990-01-01", calendar="standard"
+    )
+    assert last_time.attributes == {"time_origin": "1990-01-01"}
+
+
+def test_coord_points(tmp_path):
+    iris.save(_time_cube([1.0, 2.0, 3.0]), str(tmp_path / "time.nc"))
+    points, units = helpers.netcdf.coord_points(tmp_path / "time.nc", "time")
+    np.testing.assert_array_equal(points, [1.0, 2.0, 3.0])
+    assert units == "days since 1990-01-01"
+    with pytest.raises(ValueError):
+        helpers.netcdf.coord_points(tmp_path / "time.nc", "depth")
+
+
+def test_record_revisions(tmp_path):
+    path = str(tmp_path / "time.nc")
+    cube = _time_cube([1.0, 2.0, 3.0])
+    iris.save(cube, path, unlimited_dimensions=["time"])
+    assert helpers.netcdf.record_revisions(path, "time") is None
+    cube.add_ancillary_variable(
+        iris.coords.AncillaryVariable(
+            np.array([0, 2, 1], dtype=np.int32),
+            var_name=helpers.netcdf.record_revision_name,
+        ),
+        0,
+    )
+    iris.save(cube, path, unlimited_dimensions=["time"])
+    assert list(helpers.netcdf.record_revisions(path, "time")) == [0, 2, 1]
@@ -1,14 +1,23 @@
 """Tests for helpers/presentation_objects.py"""
 
 import datetime
+import json
+import os
 from pathlib import Path
+from unittest import mock
 
 import cf_units
+import imageio.v3 as imageio
 import iris
+import iris.coords
+import iris.cube
 import matplotlib.pyplot as plt
+import numpy as np
 import pytest
 import yaml
 
+import helpers.netcdf
+import helpers.presentation_objects as presentation_objects
 from helpers.exceptions import InvalidMapTypeException, PresentationException
 from helpers.presentation_objects import (
     MapLoader,
@@ -17,6 +26,8 @@ from helpers.presentation_objects import (
     ScalarLoader,
     TemporalmapLoader,
     TimeseriesLoader,
+    available_cpus,
+    create_dicts,
     format_dates,
     format_label,
     format_title,
@@ -123,7 +134,7 @@ def test_temporalmap_object(tmp_path, monkeypatch):
     temporalmap = PresentationObject(tmp_path, path)
     assert isinstance(temporalmap.loader, TemporalmapLoader)
 
-    monkeypatch.setattr("helpers.map_type_handling.global_ocean_plot", mockreturn)
+    _mock_renderer(monkeypatch, mockreturn)
     result = temporalmap.create_dict()
     cube = iris.load_cube(path)
     expected_result = {
@@ -187,3 +198,383 @@ def test_scalar_object_created(tmp_path):
     sdiag_presentation = PresentationObject("", sdiag_file)
     assert isinstance(sdiag_presentation.loader, ScalarLoader)
     assert sdiag_presentation.create_dict() == {"presentation_type": "text", **sdiag}
+
+
+def _mock_renderer(monkeypatch, plot):
+    """Replace the MapRenderer of temporal maps with a new figure from plot per frame"""
+
+    class MockRenderer:
+        def __init__(self, map_type, **kwargs):
+            self.fig = None
+
+        def render(self, cube, **kwargs):
+            self.close()
+            self.fig = plot(cube, **kwargs)
+            return self.fig
+
+        def close(self):
+            if self.fig is not None:
+                plt.close(self.fig)
+
+    # patched before the worker processes are forked
+    monkeypatch.setattr("helpers.presentation_objects.MapRenderer", MockRenderer)
+
+
+def _temporalmap_file(tmp_path, years=3):
+    time = iris.coords.DimCoord(
+        [365.0 * year + 182.0 for year in range(years)],
+        standard_name="time",
+        units=cf_units.Unit("days since 1990-01-01", calendar="365_day"),
+    )
+    cube = iris.cube.Cube(
+        np.arange(years * 6, dtype=float).reshape(years, 6),
+        long_name="near-surface air temperature",
+        var_name="tas",
+        units="K",
+        dim_coords_and_dims=[(time, 0)],
+        aux_coords_and_dims=[
+            (
+                iris.coords.AuxCoord(
+                    [-45.0, -45.0, 0.0, 0.0, 45.0, 45.0], standard_name="latitude"
+                ),
+                1,
+            ),
+            (
+                iris.coords.AuxCoord(
+                    [0.0, 180.0, 0.0, 180.0, 0.0, 180.0], standard_name="longitude"
+                ),
+                1,
+            ),
+        ],
+        attributes={
+            "diagnostic_type": "temporal map",
+            "map_type": "global atmosphere",
+            "title": "Title",
+            "comment": "Comment",
+        },
+    )
+    path = tmp_path / "tas_oifs_year_mean_temporalmap.nc"
+    iris.save(cube, str(path))
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_temporalmap_parallel_frames(tmp_path, monkeypatch, workers):
+    def mockreturn(cube, **kwargs):
+        fig = plt.figure()
+        fig.patch.set_facecolor("red" if kwargs["dates"] == "existing" else "white")
+        return fig
+
+    _mock_renderer(monkeypatch, mockreturn)
+    path = _temporalmap_file(tmp_path)
+    dst_folder = tmp_path / "report"
+    dst_folder.mkdir()
+    frames_dir = dst_folder / "tas_oifs_year_mean_temporalmap_frames"
+    frames_dir.mkdir()
+    # an existing frame is kept and not rendered again
+    fig = mockreturn(None, dates="existing")
+    fig.savefig(
+        frames_dir / "tas_oifs_year_mean_temporalmap-000.png", bbox_inches="tight"
+    )
+    plt.close(fig)
+    existing_frame = (
+        frames_dir / "tas_oifs_year_mean_temporalmap-000.png"
+    ).read_bytes()
+
+    result = PresentationObject(dst_folder, path, workers=workers).create_dict()
+
+    assert result["path"] == "./tas_oifs_year_mean_temporalmap.gif"
+    assert sorted(png.name for png in frames_dir.glob("*.png")) == [
+        f"tas_oifs_year_mean_temporalmap-{ts:03}.png" for ts in range(3)
+    ]
+    assert (
+        frames_dir / "tas_oifs_year_mean_temporalmap-000.png"
+    ).read_bytes() == existing_frame
+    assert (dst_folder / "tas_oifs_year_mean_temporalmap.gif").exists()
+
+
+def test_temporalmap_append_frames(tmp_path, monkeypatch):
+    def mockreturn(cube, **kwargs):
+        fig = plt.figure(figsize=(2, 1))
+        fig.patch.set_facecolor(("red", "green", "blue")[int(cube.data[0]) // 6])
+        return fig
+
+    _mock_renderer(monkeypatch, mockreturn)
+    encoded = []
+    gif_frame = presentation_objects._gif_frame
+    monkeypatch.setattr(
+        presentation_objects,
+        "_gif_frame",
+        lambda png, size: encoded.append(png.name) or gif_frame(png, size),
+    )
+    dst_folder = tmp_path / "report"
+    dst_folder.mkdir()
+    gif_file = dst_folder / "tas_oifs_year_mean_temporalmap.gif"
+
+    PresentationObject(
+        dst_folder, _temporalmap_file(tmp_path, years=2), workers=1
+    ).create_dict()
+    assert len(encoded) == 2
+    # next leg: only the new frame is encoded and appended
+    encoded.clear()
+    PresentationObject(
+        dst_folder, _temporalmap_file(tmp_path, years=3), workers=1
+    ).create_dict()
+    assert encoded == ["tas_oifs_year_mean_temporalmap-002.png"]
+    frames = imageio.imread(gif_file, index=None)
+    assert frames.shape[0] == 3
+    assert [tuple(frame[0, 0, :3]) for frame in frames] == [
+        (255, 0, 0),
+        (0, 128, 0),
+        (0, 0, 255),
+    ]
+
+    # an incomplete GIF is rebuilt from all frames
+    gif_file.write_bytes(gif_file.read_bytes()[:-1])
+    encoded.clear()
+    PresentationObject(
+        dst_folder, _temporalmap_file(tmp_path, years=3), workers=1
+    ).create_dict()
+    assert len(encoded) == 3
+    assert imageio.imread(gif_file, index=None).shape[0] == 3
+
+
+def test_temporalmap_frame_manifest(tmp_path, monkeypatch):
+    rendered = []
+
+    def mockreturn(cube, **kwargs):
+        rendered.append(kwargs["dates"])
+        return plt.figure(figsize=(2, 1))
+
+    _mock_renderer(monkeypatch, mockreturn)
+    dst_folder = tmp_path / "report"
+    dst_folder.mkdir()
+    frames_dir = dst_folder / "tas_oifs_year_mean_temporalmap_frames"
+    path = _temporalmap_file(tmp_path, years=2)
+    PresentationObject(dst_folder, path, workers=1).create_dict()
+    assert rendered == ["1990", "1991"]
+    assert json.loads((frames_dir / "frames.json").read_text()) == {
+        "182.0": "tas_oifs_year_mean_temporalmap-000.png",
+        "547.0": "tas_oifs_year_mean_temporalmap-001.png",
+    }
+
+    # without new time points, the diagnostic is not loaded
+    rendered.clear()
+    with mock.patch("iris.load_cube") as load_cube:
+        PresentationObject(dst_folder, path, workers=1).create_dict()
+    load_cube.assert_not_called()
+    assert rendered == []
+
+    # a missing frame is rendered again, together with the new time points
+    (frames_dir / "tas_oifs_year_mean_temporalmap-000.png").unlink()
+    PresentationObject(
+        dst_folder, _temporalmap_file(tmp_path, years=3), workers=1
+    ).create_dict()
+    assert rendered == ["1990", "1992"]
+    assert len(json.loads((frames_dir / "frames.json").read_text())) == 3
+
+
+def test_temporalmap_inserted_frame(tmp_path, monkeypatch):
+    def mockreturn(cube, **kwargs):
+        fig = plt.figure(figsize=(2, 1))
+        fig.patch.set_facecolor(("red", "green", "blue")[int(cube.data[0]) // 6])
+        return fig
+
+    _mock_renderer(monkeypatch, mockreturn)
+    dst_folder = tmp_path / "report"
+    dst_folder.mkdir()
+    path = _temporalmap_file(tmp_path, years=3)
+    cube = iris.load_cube(str(path))
+    cube.data  # realise data before overwriting the file
+    iris.save(cube[::2], str(path))
+    PresentationObject(dst_folder, path, workers=1).create_dict()
+
+    # a leg that was processed late is inserted in the middle
+    iris.save(cube, str(path))
+    result = PresentationObject(dst_folder, path, workers=1).create_dict()
+    frames = imageio.imread(dst_folder / result["path"], index=None)
+    assert [tuple(frame[0, 0, :3]) for frame in frames] == [
+        (255, 0, 0),
+        (0, 128, 0),
+        (0, 0, 255),
+    ]
+
+
+def test_temporalmap_replaced_frame(tmp_path, monkeypatch):
+    rendered = []
+
+    def mockreturn(cube, **kwargs):
+        rendered.append(kwargs["dates"])
+        fig = plt.figure(figsize=(2, 1))
+        fig.patch.set_facecolor(("red", "green", "blue")[int(cube.data[0]) // 6])
+        return fig
+
+    _mock_renderer(monkeypatch, mockreturn)
+    dst_folder = tmp_path / "report"
+    dst_folder.mkdir()
+    path = _temporalmap_file(tmp_path, years=2)
+    PresentationObject(dst_folder, path, workers=1).create_dict()
+
+    # the last leg was run again, with different data at the same time
+    cube = iris.load_cube(str(path))
+    cube.data[1] = 12.0
+    cube.add_ancillary_variable(
+        iris.coords.AncillaryVariable(
+            np.array([0, 1], dtype=np.int32),
+            var_name=helpers.netcdf.record_revision_name,
+        ),
+        0,
+    )
+    iris.save(cube, str(path))
+    rendered.clear()
+    result = PresentationObject(dst_folder, path, workers=1).create_dict()
+    assert rendered == ["1991"]
+    frames = imageio.imread(dst_folder / result["path"], index=None)
+    assert [tuple(frame[0, 0, :3]) for frame in frames] == [
+        (255, 0, 0),
+        (0, 0, 255),
+    ]
+
+
+def test_temporalmap_frame_size(tmp_path, monkeypatch):
+    def mockreturn(cube, **kwargs):
+        return plt.figure(figsize=(4, 2), dpi=100)
+
+    _mock_renderer(monkeypatch, mockreturn)
+    dst_folder = tmp_path / "report"
+    dst_folder.mkdir()
+    result = PresentationObject(
+        dst_folder,
+        _temporalmap_file(tmp_path),
+        workers=1,
+        frame_rate=4,
+        max_frame_size=101,
+    ).create_dict()
+    assert result["path"] == "./tas_oifs_year_mean_temporalmap.gif"
+    frames = imageio.imread(dst_folder / result["path"], index=None)
+    assert frames.shape[0] == 3
+    assert max(frames.shape[1:3]) == 101
+    assert imageio.immeta(dst_folder / result["path"])["duration"] == 250
+
+
+@pytest.mark.parametrize("animation_format", ["mp4", "webm", "webp"])
+def test_temporalmap_video(tmp_path, monkeypatch, animation_format):
+    pytest.importorskip("av")
+
+    def mockreturn(cube, **kwargs):
+        fig = plt.figure(figsize=(3, 1.5), dpi=99)
+        fig.patch.set_facecolor(("red", "green", "blue")[int(cube.data[0]) // 6])
+        return fig
+
+    _mock_renderer(monkeypatch, mockreturn)
+    dst_folder = tmp_path / "report"
+    dst_folder.mkdir()
+    result = PresentationObject(
+        dst_folder,
+        _temporalmap_file(tmp_path),
+        workers=1,
+        animation_format=animation_format,
+    ).create_dict()
+    assert result["path"] == f"./tas_oifs_year_mean_temporalmap.{animation_format}"
+    # FFmpeg does not decode animated WebP
+    plugin = "pillow" if animation_format == "webp" else "pyav"
+    frames = imageio.imread(dst_folder / result["path"], index=..., plugin=plugin)
+    assert frames.shape[0] == 3
+    assert frames.shape[1] % 2 == frames.shape[2] % 2 == 0
+
+
+def test_temporalmap_invalid_animation_format(tmp_path):
+    loader = get_loader(_temporalmap_file(tmp_path))
+    pytest.raises(PresentationException, loader.load, tmp_path, animation_format="avi")
+
+
+def _timeseries_file(path, values):
+    time = iris.coords.DimCoord(
+        [182.0 + 365 * year for year in range(len(values))],
+        standard_name="time",
+        units=cf_units.Unit("days since 1990-01-01", calendar="365_day"),
+    )
+    cube = iris.cube.Cube(
+        np.array(values, dtype=float),
+        long_name="sea surface temperature",
+        var_name="tos",
+        units="degC",
+        dim_coords_and_dims=[(time, 0)],
+        attributes={
+            "diagnostic_type": "time series",
+            "title": "Title",
+            "comment": "Comment",
+        },
+    )
+    iris.save(cube, str(path))
+    return path
+
+
+def test_timeseries_render_cache(tmp_path, monkeypatch):
+    path = _timeseries_file(tmp_path / "tos_timeseries.nc", [1.0, 2.0, 3.0])
+    report = tmp_path / "report"
+    report.mkdir()
+    result = PresentationObject(report, path).create_dict()
+    png = (report / result["path"]).read_bytes()
+
+    # the same diagnostic in another report is copied from the cache
+    # without loading the cube
+    figure = mock.Mock(side_effect=plt.figure)
+    monkeypatch.setattr(plt, "figure", figure)
+    load_cube = mock.Mock(side_effect=iris.load_cube)
+    monkeypatch.setattr(iris, "load_cube", load_cube)
+    other_report = tmp_path / "other_report"
+    other_report.mkdir()
+    assert PresentationObject(other_report, path).create_dict() == result
+    assert (other_report / result["path"]).read_bytes() == png
+    figure.assert_not_called()
+    load_cube.assert_not_called()
+
+    # new options or data are plotted again
+    PresentationObject(other_report, path, value_range=[0, 5]).create_dict()
+    assert figure.call_count == load_cube.call_count == 1
+    _timeseries_file(path, [1.0, 2.0, 3.0, 4.0])
+    PresentationObject(other_report, path).create_dict()
+    assert figure.call_count == 2
+    assert (other_report / result["path"]).read_bytes() != png
+
+
+def test_render_independent_of_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "report").mkdir()
+    (tmp_path / "elsewhere").mkdir()
+    _timeseries_file(tmp_path / "tos.nc", [1.0, 2.0, 3.0])
+    pres_object = PresentationObject("report", tmp_path / "tos.nc")
+    # e.g. another task changes the working directory in the meantime
+    monkeypatch.chdir(tmp_path / "elsewhere")
+    monkeypatch.setattr(os, "chdir", mock.Mock(side_effect=AssertionError))
+    result = pres_object.create_dict()
+    assert (tmp_path / "report" / result["path"]).exists()
+    assert not list((tmp_path / "elsewhere").iterdir())
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_create_dicts(tmp_path, workers):
+    report = tmp_path / "report"
+    report.mkdir()
+    sources = [
+        str(_timeseries_file(tmp_path / "tos_0.nc", [1.0, 2.0])),
+        str(tmp_path / "missing.yml"),
+        {"path": str(_timeseries_file(tmp_path / "tos_1.nc", [3.0, 4.0]))},
+        str(_timeseries_file(tmp_path / "tos_2.nc", [5.0, 6.0])),
+    ]
+    results = create_dicts(sources, report, workers=workers)
+    assert [results[n]["path"] for n in (0, 2, 3)] == [
+        "./tos_0.png",
+        "./tos_1.png",
+        "./tos_2.png",
+    ]
+    assert isinstance(results[1], PresentationException)
+    assert str(results[1]) == f"File not found: {tmp_path / 'missing.yml'}"
+    assert sorted(png.name for png in report.iterdir()) == [
+        f"tos_{n}.png" for n in range(3)
+    ]
+
+
+def test_available_cpus():
+    assert 1 <= available_cpus() <= os.cpu_count()
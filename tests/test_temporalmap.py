@@ -2,9 +2,16 @@
 
 from pathlib import Path
 
+import cf_units
+import iris
+import netCDF4
+import numpy as np
 import pytest
 import scriptengine.exceptions
+from iris.coords import DimCoord
+from iris.cube import Cube
 
+import helpers.netcdf
 from monitoring.temporalmap import Temporalmap
 
 
@@ -20,3 +27,135 @@ def test_temporalmap_dst_error():
 def test_temporalmap_run():
     temporalmap = Temporalmap({})
     pytest.raises(NotImplementedError, temporalmap.run, {})
+
+
+def _temporalmap_cube(year, data_offset=0.0):
+    time_unit = cf_units.Unit(f"days since {year}-01-01", calendar="standard")
+    time = DimCoord(
+        [15.0, 45.0],
+        standard_name="time",
+        var_name="time",
+        units=time_unit,
+        bounds=[[0.0, 30.0], [30.0, 60.0]],
+    )
+    lat = DimCoord([0.0, 1.0, 2.0], standard_name="latitude", units="degrees")
+    lon = DimCoord([0.0, 1.0, 2.0, 3.0], standard_name="longitude", units="degrees")
+    return Cube(
+        np.arange(24, dtype="float32").reshape(2, 3, 4) + data_offset,
+        var_name="tos",
+        units="degC",
+        dim_coords_and_dims=[(time, 0), (lat, 1), (lon, 2)],
+    )
+
+
+def test_temporalmap_append_in_place(tmp_path):
+    dst = tmp_path / "test.nc"
+    temporalmap = Temporalmap({})
+    for leg, year in enumerate((1990, 1991, 1992)):
+        temporalmap.save(_temporalmap_cube(year, data_offset=100.0 * leg), dst)
+
+    assert helpers.netcdf.unlimited_dimension(dst) == "time"
+    with netCDF4.Dataset(dst) as dataset:
+        assert dataset.variables["tos"].chunking() == [2, 3, 4]
+
+    cube = iris.load_cube(str(dst))
+    assert cube.shape == (6, 3, 4)
+    assert cube.attributes["diagnostic_type"] == "temporal map"
+    assert (cube.data[::2, 0, 0] == [0.0, 100.0, 200.0]).all()
+    assert (cube.coord("time").points == [15.0, 45.0, 380.0, 410.0, 745.0, 775.0]).all()
+
+
+def test_temporalmap_append_overlap(tmp_path):
+    dst = tmp_path / "test.nc"
+    temporalmap = Temporalmap({})
+    temporalmap.save(_temporalmap_cube(1991), dst)
+    pytest.raises(
+        scriptengine.exceptions.ScriptEngineTaskRunError,
+        temporalmap.save,
+        _temporalmap_cube(1991),
+        dst,
+    )
+    assert iris.load_cube(str(dst)).shape == (2, 3, 4)
+
+
+def test_temporalmap_append_incompatible(tmp_path):
+    dst = tmp_path / "test.nc"
+    temporalmap = Temporalmap({})
+    temporalmap.save(_temporalmap_cube(1990), dst)
+    wrong_units = _temporalmap_cube(1991)
+    wrong_units.units = "K"
+    wrong_grid = _temporalmap_cube(1991)[:, :2]
+    for new_cube in (wrong_units, wrong_grid):
+        pytest.raises(
+            scriptengine.exceptions.ScriptEngineTaskRunError,
+            temporalmap.save,
+            new_cube,
+            dst,
+        )
+    cube = iris.load_cube(str(dst))
+    assert cube.shape == (2, 3, 4)
+    assert cube.units == "degC"
+
+
+def test_temporalmap_insert_out_of_order(tmp_path):
+    dst = tmp_path / "test.nc"
+    temporalmap = Temporalmap({})
+    for leg in (1, 3, 0, 2):
+        temporalmap.save(_temporalmap_cube(1990 + leg, 100.0 * leg), dst)
+    cube = iris.load_cube(str(dst))
+    assert cube.shape == (8, 3, 4)
+    assert (cube.data[::2, 0, 0] == [0.0, 100.0, 200.0, 300.0]).all()
+    assert (np.diff(cube.coord("time").points) > 0).all()
+    with netCDF4.Dataset(dst) as dataset:
+        assert dataset.variables["tos"].chunking() == [2, 3, 4]
+
+    # a leg between two stored ones must fit in between
+    overlapping = _temporalmap_cube(1991)
+    overlapping.coord("time").bounds = [[30.0, 60.0], [60.0, 380.0]]
+    pytest.raises(
+        scriptengine.exceptions.ScriptEngineTaskRunError,
+        temporalmap.save,
+        overlapping,
+        dst,
+    )
+    assert iris.load_cube(str(dst)).shape == (8, 3, 4)
+
+
+def test_temporalmap_replace_overlap(tmp_path, monkeypatch):
+    dst = tmp_path / "test.nc"
+    temporalmap = Temporalmap({})
+    temporalmap.save(_temporalmap_cube(1990), dst)
+    temporalmap.save(_temporalmap_cube(1991), dst)
+    # the rerun leg is checked against the last maps only
+    monkeypatch.setattr(iris, "load_cube", None)
+    temporalmap.save(_temporalmap_cube(1991, 100.0), dst, replace_overlap=True)
+    monkeypatch.undo()
+
+    cube = iris.load_cube(str(dst))
+    assert cube.shape == (4, 3, 4)
+    assert (cube.data[:, 0, 0] == [0.0, 12.0, 100.0, 112.0]).all()
+    # the replacements are counted for the presentation
+    assert list(helpers.netcdf.record_revisions(dst, "time")) == [0, 0, 1, 1]
+    temporalmap.save(_temporalmap_cube(1991, 200.0), dst, replace_overlap=True)
+    assert list(helpers.netcdf.record_revisions(dst, "time")) == [0, 0, 2, 2]
+    pytest.raises(
+        scriptengine.exceptions.ScriptEngineTaskRunError,
+        temporalmap.save,
+        _temporalmap_cube(1990),
+        dst,
+        replace_overlap=True,
+    )
+
+
+def test_temporalmap_append_fixed_dimension(tmp_path):
+    dst = tmp_path / "test.nc"
+    cube = _temporalmap_cube(1990)
+    cube.attributes["diagnostic_type"] = "temporal map"
+    iris.save(cube, str(dst))
+    assert helpers.netcdf.unlimited_dimension(dst) is None
+
+    temporalmap = Temporalmap({})
+    temporalmap.save(_temporalmap_cube(1991), dst)
+    assert helpers.netcdf.unlimited_dimension(dst) == "time"
+    assert iris.load_cube(str(dst)).shape == (4, 3, 4)
+    assert list(helpers.netcdf.record_revisions(dst, "time")) == [0, 0, 0, 0]
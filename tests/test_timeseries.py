@@ -8,6 +8,7 @@ import pytest
 import scriptengine.exceptions
 
 import helpers.cubes
+import helpers.netcdf
 from monitoring.timeseries import Timeseries
 
 
@@ -26,7 +27,7 @@ def test_timeseries_dst_error():
     )
 
 
-def test_monotonic_increase():
+def test_record_index():
     init = {
         "title": "A Test Diagnostic",
         "dst": "dst_file.nc",
@@ -37,27 +38,24 @@ def test_monotonic_increase():
 
     old_coord = iris.coords.DimCoord([1])
     new_coord = iris.coords.DimCoord([2])
-    assert time_series.test_monotonic_increase(old_coord, new_coord) is None
+    assert time_series.record_index(old_coord, new_coord) == 1
+    assert time_series.record_index(new_coord, old_coord) == 0
     pytest.raises(
         scriptengine.exceptions.ScriptEngineTaskRunError,
-        time_series.test_monotonic_increase,
-        new_coord,
+        time_series.record_index,
+        old_coord,
         old_coord,
     )
 
     old_coord_with_bounds = iris.coords.DimCoord([1], bounds=[0.5, 1.5])
     new_coord_with_bounds = iris.coords.DimCoord([2], bounds=[1.5, 2.5])
-    assert (
-        time_series.test_monotonic_increase(
-            old_coord_with_bounds, new_coord_with_bounds
-        )
-        is None
-    )
+    overlapping_coord = iris.coords.DimCoord([1.5], bounds=[1.0, 2.0])
+    assert time_series.record_index(old_coord_with_bounds, new_coord_with_bounds) == 1
     pytest.raises(
         scriptengine.exceptions.ScriptEngineTaskRunError,
-        time_series.test_monotonic_increase,
-        new_coord_with_bounds,
+        time_series.record_index,
         old_coord_with_bounds,
+        overlapping_coord,
     )
 
 
@@ -108,7 +106,50 @@ def test_time_series_append(tmp_path):
     assert cube.coord().units.name == "1"
 
 
-def test_time_series_append_nonmonotonic(tmp_path):
+def test_time_series_append_in_place(tmp_path):
+    init = {
+        "title": "A Test Diagnostic",
+        "dst": str(tmp_path / "dst.nc"),
+        "data_value": 0.0,
+        "coord_value": 0,
+    }
+    for leg in range(3):
+        init["data_value"] = 10.0 * leg
+        init["coord_value"] = leg
+        time_series = Timeseries(init)
+        time_series.run(init)
+        assert helpers.netcdf.unlimited_dimension(init["dst"]) == "time"
+
+    cube = iris.load_cube(init["dst"])
+    assert (cube.data == [0.0, 10.0, 20.0]).all()
+    assert (cube.coord("time").points == [0, 1, 2]).all()
+    assert cube.attributes["diagnostic_type"] == "time series"
+
+
+def test_time_series_append_fixed_dimension(tmp_path):
+    init = {
+        "title": "A Test Diagnostic",
+        "dst": str(tmp_path / "dst.nc"),
+        "data_value": 0,
+        "coord_value": 0,
+    }
+    time_series = Timeseries(init)
+    time_series.run(init)
+    # rewrite as a file without unlimited dimension, like older versions did
+    cube = iris.load_cube(init["dst"])
+    cube.data  # realise data before overwriting the file
+    iris.save(cube, init["dst"])
+    assert helpers.netcdf.unlimited_dimension(init["dst"]) is None
+
+    init["coord_value"] = 1
+    time_series = Timeseries(init)
+    time_series.run(init)
+    assert helpers.netcdf.unlimited_dimension(init["dst"]) == "time"
+    cube = iris.load_cube(init["dst"])
+    assert (cube.coord("time").points == [0, 1]).all()
+
+
+def test_time_series_append_overlap(tmp_path):
     init = {
         "title": "A Test Diagnostic",
         "dst": str(tmp_path / "dst_file.nc"),
@@ -118,8 +159,6 @@ def test_time_series_append_nonmonotonic(tmp_path):
     time_series = Timeseries(init)
     time_series.run(init)
 
-    init["coord_value"] = 0
-
     time_series = Timeseries(init)
     pytest.raises(
         scriptengine.exceptions.ScriptEngineTaskRunError,
@@ -128,6 +167,63 @@ def test_time_series_append_nonmonotonic(tmp_path):
     )
 
 
+def test_time_series_insert_out_of_order(tmp_path):
+    init = {
+        "title": "A Test Diagnostic",
+        "dst": str(tmp_path / "dst.nc"),
+        "data_value": 0.0,
+        "coord_value": 0,
+    }
+    for leg in (1, 4, 0, 2, 5, 3):
+        init["data_value"] = 10.0 * leg
+        init["coord_value"] = leg
+        Timeseries(init).run(init)
+    assert helpers.netcdf.unlimited_dimension(init["dst"]) == "time"
+    cube = iris.load_cube(init["dst"])
+    assert (cube.coord("time").points == [0, 1, 2, 3, 4, 5]).all()
+    assert (cube.data == [0.0, 10.0, 20.0, 30.0, 40.0, 50.0]).all()
+
+
+def test_time_series_replace_overlap(tmp_path):
+    init = {
+        "title": "A Test Diagnostic",
+        "dst": str(tmp_path / "dst.nc"),
+        "data_value": 0.0,
+        "coord_value": 0,
+        "replace_overlap": True,
+    }
+    for leg, value in ((0, 0.0), (1, 10.0), (1, 11.0)):
+        init["coord_value"], init["data_value"] = leg, value
+        Timeseries(init).run(init)
+    cube = iris.load_cube(init["dst"])
+    assert (cube.data == [0.0, 11.0]).all()
+    assert (cube.coord("time").points == [0, 1]).all()
+
+    # an earlier record is not replaced
+    init["coord_value"] = 0
+    pytest.raises(
+        scriptengine.exceptions.ScriptEngineTaskRunError,
+        Timeseries(init).run,
+        init,
+    )
+
+
+def test_time_series_replace_overlap_coord_name(tmp_path):
+    init = {
+        "title": "A Test Diagnostic",
+        "dst": str(tmp_path / "dst.nc"),
+        "coord_name": "Leg Number",
+        "replace_overlap": True,
+    }
+    for leg, value in ((1, 0.0), (2, 10.0), (2, 11.0)):
+        init["coord_value"], init["data_value"] = leg, value
+        Timeseries(init).run(init)
+    cube = iris.load_cube(init["dst"])
+    assert (cube.data == [0.0, 11.0]).all()
+    assert (cube.coord("Leg Number").points == [1, 2]).all()
+    assert helpers.netcdf.unlimited_dimension(init["dst"]) == "Leg_Number"
+
+
 def test_time_series_date_time(tmp_path):
     seconds_value = (
         datetime.datetime(1990, 1, 1) - datetime.datetime(1900, 1, 1)